@@ -1,31 +1,76 @@
 from django.contrib import admin
-from .models import Question, AppSetting
+from django.contrib.admin.views.main import ORDER_VAR
+from .models import Event, Question, AppSetting, ArchivedQuestion
+from .search import postgres_search, search_questions
 
+# moderate() notifies screens/moderators once per event for the whole selection
 @admin.action(description="Approve selected questions")
 def approve_selected(modeladmin, request, queryset):
-    queryset.update(status=Question.STATUS_APPROVED)
+    changed = queryset.moderate("approve", reason="admin_action")
+    modeladmin.message_user(request, f"{changed} question(s) approved.")
 
 @admin.action(description="Reject selected questions")
 def reject_selected(modeladmin, request, queryset):
-    queryset.update(status=Question.STATUS_REJECTED)
+    changed = queryset.moderate("reject", reason="admin_action")
+    modeladmin.message_user(request, f"{changed} question(s) rejected.")
+
+@admin.register(Event)
+class EventAdmin(admin.ModelAdmin):
+    list_display = ("slug", "name", "created_at")
+    search_fields = ("slug", "name")
+    prepopulated_fields = {"slug": ("name",)}
+    readonly_fields = ("created_at",)
 
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "status", "created_at", "question_preview")
-    list_filter = ("status", "created_at")
+    list_display = ("id", "event", "name", "status", "created_at", "question_preview")
+    list_filter = ("event", "status", "created_at")
+    list_select_related = ("event",)
     search_fields = ("name", "question")
     ordering = ("-created_at",)
     actions = [approve_selected, reject_selected]
     readonly_fields = ("created_at",)
+    raw_id_fields = ("duplicate_of",)
+
+    def get_search_results(self, request, queryset, search_term):
+        # indexed, ranked full-text + trigram search instead of ILIKE '%term%' scans;
+        # best match first unless a column sort is picked
+        if search_term.strip() and postgres_search(queryset.db):
+            results = search_questions(queryset, search_term)
+            if ORDER_VAR in request.GET:
+                results = results.order_by(*queryset.query.order_by)
+            return results, False
+        return super().get_search_results(request, queryset, search_term)
+
+    def delete_queryset(self, request, queryset):
+        # "Delete selected": one batched notification instead of one per row
+        queryset.moderate("delete", reason="admin_delete")
 
     def question_preview(self, obj):
         s = obj.question
         return s if len(s) <= 80 else (s[:77] + "…")
     question_preview.short_description = "Question"
 
+@admin.register(ArchivedQuestion)
+class ArchivedQuestionAdmin(admin.ModelAdmin):
+    # written only by `manage.py qa_retention`
+    list_display = ("id", "event", "name", "status", "created_at", "archived_at")
+    list_filter = ("event", "status")
+    list_select_related = ("event",)
+    search_fields = ("name", "question")
+    ordering = ("-created_at",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(AppSetting)
 class AppSettingAdmin(admin.ModelAdmin):
-    list_display = ("event_title", "max_question_length", "submissions_enabled")
+    list_display = ("event", "event_title", "max_question_length", "submissions_enabled")
+    list_select_related = ("event",)
 
     def has_add_permission(self, request):
+        # created with its event on first use (AppSetting.get_solo)
         return False
@@ -6,3 +6,8 @@ class QaConfig(AppConfig):
 
     def ready(self):
         from . import signals  # noqa
+        from . import metrics
+
+        if metrics.enabled():
+            from django.db.backends.signals import connection_created
+            connection_created.connect(metrics.install_db_wrapper, dispatch_uid="qa.metrics.db")
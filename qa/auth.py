@@ -0,0 +1,68 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Who is logged in, without the database. Every staff request and moderation
+# socket handshake resolves session -> user; with cached_db sessions (settings)
+# and this backend both come out of the shared cache in the steady state, so a
+# wave of moderator tabs reconnecting after a deploy doesn't become a wave of
+# session and auth_user queries.
+#
+# A cached user is dropped when the user is saved (staff flag, password, active),
+# deleted or logs out; see qa.signals. Changes that skip save() (QuerySet.update)
+# show up after QA_AUTH_CACHE_TTL seconds.
+
+
+def user_cache_key(user_id):
+    return f"qa:auth:user:{user_id}"
+
+
+def _ttl():
+    return getattr(settings, "QA_AUTH_CACHE_TTL", 300)
+
+
+def forget_user(user_id):
+    """Drop the cached copy of a user, once the surrounding transaction commits."""
+    transaction.on_commit(lambda: cache.delete(user_cache_key(user_id)))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user() — behind request.user, request.auser() and the
+    websocket AuthMiddleware — reads the user from the shared cache first.
+    Unknown users are not cached; inactive ones are refused as usual. If the
+    cache can't be reached it just asks the database.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        try:
+            user = cache.get(key)
+        except Exception:
+            logger.exception("user cache read failed")
+            return super().get_user(user_id)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, _ttl())
+            return user
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = user_cache_key(user_id)
+        try:
+            user = await cache.aget(key)
+        except Exception:
+            logger.exception("user cache read failed")
+            return await super().aget_user(user_id)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await cache.aset(key, user, _ttl())
+            return user
+        return user if self.user_can_authenticate(user) else None
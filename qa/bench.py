@@ -0,0 +1,470 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+import uuid
+from urllib.parse import urlencode
+
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import render
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_http_methods
+
+from . import views
+from .dedup import save_new_question
+from .forms import AskForm
+from .ingest import IngestBackpressure, enqueue_question, queue_mode
+from .models import AppSetting, Event, Question
+from .pagination import fetch_page, page_params
+from .ratelimit import ask_allowed, set_device_cookie
+from .realtime import QUESTION_FIELDS, current_version, settings_version
+from .snapshots import get_snapshot, snapshot_response
+
+BENCH_NAME = "[bench]"
+
+# In-process backends so a benchmark never touches the real Redis
+MEMORY_BACKENDS = {
+    "CHANNEL_LAYERS": {"default": {"BACKEND": "qa.layers.InProcessChannelLayer"}},
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    "QA_RATELIMIT_BACKEND": "local",
+    "QA_DEDUP_BACKEND": "local",
+    "QA_REPLAY_BACKEND": "local",
+}
+
+# Every simulated phone has its own IP and device, but the limiter still runs.
+# The test clients and asgi_post() send Host: testserver (added to ALLOWED_HOSTS).
+BENCH_SETTINGS = {
+    "QA_ASK_RATE": "1000000/m",
+    "QA_ASK_IP_RATE": "1000000/m",
+}
+
+# Queries per request that must not grow with the data: `qa_bench pipeline` fails
+# when one is exceeded (settings read per submission, an N+1 on the moderation list)
+QUERY_BUDGETS = {
+    # the INSERT; settings come from the per-process AppSetting cache
+    "queries POST /ask/": 1,
+    # the page (similar counts in the same SELECT) and the total
+    "queries GET /moderation/pending.json": 2,
+}
+
+# Metrics where a bigger number is better; for everything else (latencies,
+# query counts) bigger is a regression
+HIGHER_IS_BETTER = {"rps"}
+COMPARED_METRICS = ("p50_ms", "p99_ms", "rps", "queries", "per_recipient_us", "connects", "server_connections")
+
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def summarize(latencies, elapsed):
+    ms = [x * 1000 for x in latencies]
+    return {
+        "n": len(ms),
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else 0.0,
+        "rps": round(len(ms) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+async def run_concurrent(make_call, total, concurrency):
+    """Await make_call(i) `total` times with at most `concurrency` in flight."""
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with sem:
+            started = time.perf_counter()
+            await make_call(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+class BenchError(Exception):
+    """A benchmarked request failed, so the numbers measured with it mean nothing."""
+
+
+def expect_ok(status, method, url):
+    if not 200 <= status < 300:
+        raise BenchError(f"{method} {url} answered {status}")
+
+
+def phone_ip(i):
+    """A distinct client address per simulated phone."""
+    return f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"
+
+
+def count_queries(client, method, url, data=None, samples=10, **extra):
+    """Mean DB queries per request, from `samples` sequential requests after a warm-up one."""
+    total = 0
+    for i in range(-1, samples):
+        with CaptureQueriesContext(connection) as ctx:
+            if method == "POST":
+                response = client.post(url, data(i) if callable(data) else (data or {}), **extra)
+            else:
+                response = client.get(url, **extra)
+        expect_ok(response.status_code, method, url)
+        if i >= 0:
+            total += len(ctx)
+    return round(total / samples, 2)
+
+
+# The test clients keep Django from closing connections at the end of a request,
+# so the db scenario calls the ASGI handler itself, the way daphne does: every
+# request in a thread of its own, connections released when it finishes.
+CSRF_SECRET = "b" * 32
+
+
+async def asgi_post(app, path, data, client_ip, timeout=60):
+    """POST a form through the ASGI application; returns the status code."""
+    body = urlencode({**data, "csrfmiddlewaretoken": CSRF_SECRET}).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "headers": [
+            (b"host", b"testserver"),
+            (b"content-type", b"application/x-www-form-urlencoded"),
+            (b"content-length", str(len(body)).encode()),
+            (b"cookie", f"csrftoken={CSRF_SECRET}".encode()),
+        ],
+        "client": (client_ip, 50000), "server": ("testserver", 80),
+    }
+    communicator = ApplicationCommunicator(app, scope)
+    await communicator.send_input({"type": "http.request", "body": body})
+    start = await communicator.receive_output(timeout)
+    while (await communicator.receive_output(timeout)).get("more_body"):
+        pass
+    await communicator.wait(timeout)
+    return start["status"]
+
+
+class ConnectionTracker:
+    """Counts connection setups (connection_created) and the threads they ran on."""
+
+    def __init__(self):
+        self.connects = 0
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def _created(self, sender, connection, **kwargs):
+        with self._lock:
+            self.connects += 1
+            self.threads.add(threading.get_ident())
+
+    def __enter__(self):
+        connection_created.connect(self._created, weak=False, dispatch_uid="qa.bench.connections")
+        return self
+
+    def __exit__(self, *exc):
+        connection_created.disconnect(dispatch_uid="qa.bench.connections")
+
+    def counts(self):
+        return {"connects": self.connects, "threads": len(self.threads)}
+
+
+def server_connections(using="default"):
+    """Connections the PostgreSQL server has open to this database, or None elsewhere."""
+    if connections[using].vendor != "postgresql":
+        return None
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()"
+        )
+        return cursor.fetchone()[0]
+
+
+class SocketWatcher:
+    """
+    Reads one websocket client's messages in the background, recording when each
+    approved question id first arrived (screens) and how many messages came in.
+    """
+
+    def __init__(self, communicator):
+        self.communicator = communicator
+        self.arrived = {}
+        self.messages = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            message = json.loads(await self.communicator.receive_from(timeout=3600))
+            now = time.perf_counter()
+            self.messages += 1
+            for change in message.get("changes", []):
+                for q in change.get("questions", []):
+                    self.arrived.setdefault(q["id"], now)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.communicator.disconnect()
+
+
+async def wait_for_arrival(watchers, ids, timeout):
+    """Wait until every watcher has seen every id (or the timeout passes)."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if all(pk in w.arrived for w in watchers for pk in ids):
+            return True
+        await asyncio.sleep(0.005)
+    return False
+
+
+async def measure_fanout(layer, group, sends, recipients):
+    """Cost of one group_send to a group of `recipients` channels."""
+    latencies = []
+    started = time.perf_counter()
+    for i in range(sends):
+        t0 = time.perf_counter()
+        await layer.group_send(group, {"type": "broadcast.refresh", "reason": "bench", "ids": [i]})
+        latencies.append(time.perf_counter() - t0)
+    row = summarize(latencies, time.perf_counter() - started)
+    row["per_recipient_us"] = round(row["mean_ms"] * 1000 / max(recipients, 1), 2)
+    return row
+
+
+async def measure_broadcast(layer, consumers, sends):
+    """
+    Broadcast latency to `consumers` channels in one group: time from group_send
+    until the last member has received the message, one message at a time.
+    """
+    group = f"bench.fanout.{consumers}"
+    channels = [await layer.new_channel() for _ in range(consumers)]
+    for channel in channels:
+        await layer.group_add(group, channel)
+
+    received = [0] * sends
+    done = [asyncio.Event() for _ in range(sends)]
+    deliveries = []
+    sent_at = {}
+
+    async def listen(channel):
+        for _ in range(sends):
+            message = await layer.receive(channel)
+            i = message["ids"][0]
+            deliveries.append(time.perf_counter() - sent_at[i])
+            received[i] += 1
+            if received[i] == consumers:
+                done[i].set()
+
+    listeners = [asyncio.ensure_future(listen(channel)) for channel in channels]
+    latencies, send_times = [], []
+    started = time.perf_counter()
+    try:
+        for i in range(sends):
+            sent_at[i] = t0 = time.perf_counter()
+            await layer.group_send(group, {"type": "broadcast.refresh", "reason": "bench", "ids": [i]})
+            send_times.append(time.perf_counter() - t0)
+            try:
+                await asyncio.wait_for(done[i].wait(), timeout=10)
+            except asyncio.TimeoutError:
+                break
+            latencies.append(time.perf_counter() - t0)
+    finally:
+        for task in listeners:
+            task.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        for channel in channels:
+            await layer.group_discard(group, channel)
+
+    row = summarize(latencies, time.perf_counter() - started)
+    row.pop("rps")
+    row["delivered"] = f"{len(deliveries)}/{sends * consumers}"
+    row["send_ms"] = round(statistics.fmean(send_times) * 1000, 3) if send_times else 0.0
+    row["per_recipient_us"] = round(row["mean_ms"] * 1000 / consumers, 2)
+    return row
+
+
+def budget_failures(results):
+    """
+    What breaks QUERY_BUDGETS, one message each: a count above its budget, or a
+    budgeted endpoint that was not measured or counted no queries at all (every
+    one of them queries something, so 0 means the requests never got through).
+    Scenarios that measure none of them have nothing to check.
+    """
+    if not QUERY_BUDGETS.keys() & results.keys():
+        return []
+    failures = []
+    for name, budget in QUERY_BUDGETS.items():
+        queries = results.get(name, {}).get("queries")
+        if not queries:
+            failures.append(f"{name}: nothing measured ({queries} queries per request)")
+        elif queries > budget:
+            failures.append(f"{name}: {queries} queries per request (budget {budget})")
+    return failures
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    [(name, metric, baseline value, current value, change)] for every metric that
+    got worse by more than `tolerance` (0.2 = 20%).
+    """
+    regressions = []
+    for name, row in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = base.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > tolerance:
+                regressions.append((name, metric, old, new, change))
+    return regressions
+
+
+def create_event():
+    """A throwaway event to benchmark in, so real events' data and screens are left alone."""
+    slug = f"bench-{uuid.uuid4().hex[:12]}"
+    return Event.objects.create(slug=slug, name=BENCH_NAME)
+
+
+def drop_event(event):
+    # the queryset delete notifies once, not per row
+    Question.objects.filter(event=event).delete()
+    event.delete()
+
+
+def seed_questions(approved, pending, event):
+    Question.objects.bulk_create(
+        [Question(event=event, name=BENCH_NAME, question=f"Bench approved {i}", status=Question.STATUS_APPROVED)
+         for i in range(approved)]
+        + [Question(event=event, name=BENCH_NAME, question=f"Bench pending {i}", status=Question.STATUS_PENDING)
+           for i in range(pending)]
+    )
+
+
+# --------------------------------------------------
+# Sync reference: the benchmarked views written the way they were before they
+# went async (sync ORM, sync cache), doing the same work as today's views so
+# only the execution model differs. Served under /bench/sync/e/<slug>/.
+# Keep them in step with qa.views.
+# --------------------------------------------------
+
+def _event(slug):
+    try:
+        return Event.resolve(slug)
+    except Event.DoesNotExist:
+        raise Http404("No such event")
+
+
+def sync_settings_json(request, event_slug):
+    event = _event(event_slug)
+    snap = get_snapshot(
+        f"settings:{event.id}", settings_version(event.id),
+        lambda: views.settings_payload(AppSetting.get_solo(event)),
+    )
+    return snapshot_response(request, snap)
+
+
+def sync_approved_questions_json(request, event_slug):
+    try:
+        limit, before, after = page_params(request, getattr(settings, "QA_SCREEN_WINDOW", 20))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    ranked = request.GET.get("order") == "votes"
+    if ranked and (before or after):
+        return HttpResponseBadRequest("order=votes is not paged")
+    event = _event(event_slug)
+    version = current_version(event.id)
+    qs = Question.objects.filter(event=event).listed(Question.STATUS_APPROVED).values(*QUESTION_FIELDS)
+
+    def page():
+        rows = fetch_page(qs, limit, before, after)
+        return {"approved": rows["rows"], "version": version, "next": rows["next"], "prev": rows["prev"]}
+
+    def window():
+        rows = list(qs.order_by("-votes", "-created_at", "-id")[:limit + 1])
+        return {"approved": rows[:limit], "version": version, "more": len(rows) > limit}
+
+    if before or after:
+        return JsonResponse(page())
+    if ranked:
+        return snapshot_response(request, get_snapshot(f"approved:{event.id}:{limit}:votes", version, window))
+    return snapshot_response(request, get_snapshot(f"approved:{event.id}:{limit}", version, page))
+
+
+@never_cache
+@views.staff_required
+def sync_pending_questions_json(request, event_slug):
+    try:
+        limit, before, after = page_params(request, getattr(settings, "QA_MODERATION_PAGE_SIZE", 100))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    event = _event(event_slug)
+    qs = Question.objects.filter(event=event).listed(Question.STATUS_PENDING)
+    rows = qs.with_similar().values(*QUESTION_FIELDS, "duplicate_of", "similar")
+    page = fetch_page(rows, limit, before, after)
+    return JsonResponse({"pending": page["rows"], "total": qs.count(), "next": page["next"], "prev": page["prev"]})
+
+
+@require_http_methods(["GET", "POST"])
+def sync_ask_view(request, event_slug):
+    event = _event(event_slug)
+    s = AppSetting.get_solo(event)
+    status = 200
+
+    if request.method == "POST":
+        form = AskForm(request.POST, app_settings=s)
+        if not ask_allowed(request):
+            form.add_error(None, "You're sending questions too quickly. Please wait a minute and try again.")
+            status = 429
+        elif form.is_valid():
+            if queue_mode():
+                try:
+                    enqueue_question(event.id, form.cleaned_data.get("name"), form.cleaned_data["question"])
+                    return set_device_cookie(request, render(request, "qa/ask_success.html", {"event": event}))
+                except IngestBackpressure:
+                    form.add_error(None, "We're receiving a lot of questions right now. Please try again in a moment.")
+                    status = 503
+            else:
+                obj = form.save(commit=False)
+                obj.event_id = event.id
+                obj.status = Question.STATUS_PENDING
+                save_new_question(obj)
+                return set_device_cookie(request, render(request, "qa/ask_success.html", {"event": event}))
+    else:
+        form = AskForm(app_settings=s)
+
+    response = render(request, "qa/ask.html", {
+        "event": event,
+        "form": form,
+        "submissions_enabled": s.submissions_enabled,
+        "max_len": s.max_question_length,
+    }, status=status)
+    return set_device_cookie(request, response)
+
+
+sync_urlpatterns = [
+    path("settings.json", sync_settings_json),
+    path("screen/approved.json", sync_approved_questions_json),
+    path("moderation/pending.json", sync_pending_questions_json),
+    path("ask/", sync_ask_view),
+]
+
+# ROOT_URLCONF while benchmarking: the real routes plus /bench/sync/...
+urlpatterns = [
+    path("bench/sync/e/<slug:event_slug>/", include(sync_urlpatterns)),
+    path("", include("realtime_questions.urls")),
+]
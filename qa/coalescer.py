@@ -0,0 +1,162 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _merge(into: dict, message: dict):
+    """Fold `message` into the pending message of the same group and type."""
+    if message["type"] == "broadcast.delta":
+        into["changes"].extend(message.get("changes", []))
+        return
+    if message["type"] == "broadcast.progress":
+        # only the latest count matters
+        into.update(message)
+        return
+
+    for reason in message.get("reasons") or [message.get("reason", "update")]:
+        if reason not in into["reasons"]:
+            into["reasons"].append(reason)
+    for pk in message.get("ids", []):
+        if pk not in into["ids"]:
+            into["ids"].append(pk)
+
+
+def _start(message: dict) -> dict:
+    if message["type"] == "broadcast.delta":
+        return {**message, "changes": list(message.get("changes", []))}
+    if message["type"] == "broadcast.progress":
+        return dict(message)
+    reasons = message.get("reasons") or [message.get("reason", "update")]
+    return {
+        **message,
+        "reason": reasons[0],
+        "reasons": list(reasons),
+        "ids": list(message.get("ids", [])),
+    }
+
+
+class BroadcastCoalescer:
+    """
+    Collapses channel-layer messages per (group, type) inside a time window and
+    sends them from a background event loop, so callers never wait on Redis.
+
+    The first message for a key opens the window; everything that arrives for
+    the same key before it closes is merged into it and counted as suppressed.
+    """
+
+    def __init__(self, window: float = 0.25, loop=None):
+        self.window = window
+        self.stats = {"received": 0, "sent": 0, "suppressed": 0, "errors": 0}
+        self._pending = {}
+        self._lock = threading.Lock()
+        # normally our own loop thread; an existing loop can be passed in (qa_bench
+        # runs its websocket clients and the in-memory channel layer on one loop)
+        self._loop = loop
+        self._thread = None
+        self._sending = set()
+
+    def submit(self, group: str, message: dict):
+        key = (group, message["type"])
+        with self._lock:
+            self.stats["received"] += 1
+            merged = self._pending.get(key)
+            if merged is not None:
+                _merge(merged, message)
+                self.stats["suppressed"] += 1
+                return
+            self._pending[key] = _start(message)
+
+        loop = self._ensure_loop()
+        loop.call_soon_threadsafe(loop.call_later, self.window, self._flush_key, key)
+
+    def flush(self, timeout: float = 5.0):
+        """Send everything pending now and wait for it (used at exit and by scripts)."""
+        if self._loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._drain(), self._loop)
+        future.result(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """flush(), then stop the loop thread if it is ours (a swapped-in coalescer)."""
+        self.flush(timeout)
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+
+    def _ensure_loop(self):
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=loop.run_forever, name="qa-broadcast", daemon=True,
+                )
+                self._thread.start()
+                self._loop = loop
+        return self._loop
+
+    def _take(self, key):
+        with self._lock:
+            return self._pending.pop(key, None)
+
+    def _flush_key(self, key):
+        message = self._take(key)
+        if message is not None:
+            task = self._loop.create_task(self._send(key[0], message))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        # and whatever a closed window already started sending
+        await asyncio.gather(*self._sending, *(self._send(group, msg) for (group, _), msg in pending.items()))
+
+    async def _send(self, group: str, message: dict):
+        layer = get_channel_layer()
+        if not layer:
+            return
+        started = time.perf_counter()
+        try:
+            await layer.group_send(group, message)
+            self.stats["sent"] += 1
+        except Exception:
+            self.stats["errors"] += 1
+            if metrics.enabled():
+                metrics.ws_messages_dropped.inc(kind=metrics.group_kind(group), reason="group_send_failed")
+            logger.exception("broadcast to %s failed", group)
+            return
+        if metrics.enabled():
+            metrics.group_send_seconds.observe(time.perf_counter() - started, kind=metrics.group_kind(group))
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer() -> BroadcastCoalescer:
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                window_ms = getattr(settings, "QA_BROADCAST_WINDOW_MS", 250)
+                _coalescer = BroadcastCoalescer(window=window_ms / 1000)
+                atexit.register(_coalescer.flush)
+    return _coalescer
+
+
+def set_coalescer(coalescer):
+    """Swap the process-wide coalescer (benchmarks); returns the previous one."""
+    global _coalescer
+    previous, _coalescer = _coalescer, coalescer
+    return previous
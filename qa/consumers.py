@@ -1,24 +1,237 @@
+import asyncio
 import json
+import logging
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 
-class ScreenConsumer(AsyncWebsocketConsumer):
-    group_name = "screens"
+from . import metrics, replay
+from .models import Event
+from .realtime import MODERATORS, SCREENS, acurrent_version, group_name
+from .views import approved_snapshot, pending_payload
 
-    async def connect(self):
+logger = logging.getLogger(__name__)
+
+# Backpressure. Broadcast handlers don't write to the socket themselves: they
+# queue the message in the connection's outbox (at most QA_WS_QUEUE_SIZE) and a
+# writer task sends it. The page answers every ping with a pong; a socket that
+# misses one is lagging, and nothing more is written to it (the server would
+# only buffer it) until it answers again. An outbox that fills up, lagging or
+# not, is replaced by a single "resync": the page reloads its state over HTTP
+# instead of replaying everything it missed. A socket silent for
+# QA_WS_IDLE_TIMEOUT seconds is closed and leaves its group. So is one whose
+# writer or heartbeat task fails: nothing would be sent to it any more.
+#
+# Right after connecting, a page gets its initial state over the socket (the
+# same data as approved.json / pending.json) instead of fetching it; a screen
+# that reconnects with ?since=<version> gets only the changes it missed.
+
+RESYNC = {"type": "resync"}
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+class EventConsumer(AsyncWebsocketConsumer):
+    # one group per (kind, event); subclasses set the kind
+    group_kind = None
+    group_name = None
+    event = None
+    counted = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outbox = deque()
+        self.lagging = False
+        self.last_seen = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    async def join_event(self):
+        """Join the event's group; False (and the socket closed) if there is no such event."""
+        slug = self.scope["url_route"]["kwargs"].get("event_slug", Event.DEFAULT_SLUG)
+        try:
+            event = await Event.aresolve(slug)
+        except Event.DoesNotExist:
+            await self.close(code=4404)
+            return False
+        self.event = event
+        self.group_name = group_name(self.group_kind, event.id)
         await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+        return True
+
+    def since(self):
+        """The ?since=<version> the page last applied, or None."""
+        values = parse_qs(self.scope.get("query_string", b"").decode()).get("since")
+        try:
+            return int(values[0]) if values else None
+        except ValueError:
+            return None
+
+    async def accept(self, subprotocol=None, headers=None):
+        await super().accept(subprotocol, headers)
+        self.last_seen = time.monotonic()
+        self._tasks = [asyncio.ensure_future(self._writer()), asyncio.ensure_future(self._heartbeat())]
+        for task in self._tasks:
+            task.add_done_callback(self._task_done)
+        if metrics.enabled():
+            self.counted = True
+            metrics.ws_connections.inc(group=self.group_name)
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        for task in self._tasks:
+            task.cancel()
+        if self.counted:
+            self.counted = False
+            metrics.ws_connections.dec(group=self.group_name)
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # pongs, but any message shows the page is reading again
+        self.last_seen = time.monotonic()
+        if self.lagging:
+            self.lagging = False
+            self._wakeup.set()
+
+    async def push(self, payload: dict):
+        """Queue payload for this socket, collapsing a full outbox into one resync."""
+        if len(self.outbox) >= _conf("QA_WS_QUEUE_SIZE", 50):
+            if metrics.enabled():
+                dropped = sum(1 for queued in self.outbox if queued is not RESYNC) + 1
+                metrics.ws_messages_dropped.inc(dropped, kind=self.group_kind, reason="collapsed")
+            self.outbox.clear()
+            payload = RESYNC
+        self.outbox.append(payload)
+        self._wakeup.set()
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.outbox and not self.lagging:
+                await self._write(self.outbox.popleft())
+
+    async def _write(self, payload: dict):
+        await self._write_text(json.dumps(payload), payload["type"])
+        if metrics.enabled():
+            self.delivered(payload)
+
+    async def _write_text(self, text: str, message_type: str):
+        try:
+            await self.send(text_data=text)
+        except Exception:
+            if metrics.enabled():
+                metrics.ws_messages_dropped.inc(kind=self.group_kind, reason="send_failed")
+            raise
+        if metrics.enabled():
+            metrics.ws_messages_sent.inc(kind=self.group_kind, type=message_type)
+
+    def delivered(self, payload: dict):
+        """Hook: payload was just written to the socket (metrics only)."""
+
+    async def _heartbeat(self):
+        interval = _conf("QA_WS_PING_INTERVAL", 15.0)
+        timeout = _conf("QA_WS_IDLE_TIMEOUT", 45.0)
+        while True:
+            await asyncio.sleep(interval)
+            silent = time.monotonic() - self.last_seen
+            if silent >= timeout:
+                await self._close_dead()
+                return
+            if silent > interval * 1.5 and not self.lagging:
+                # the previous ping went unanswered
+                self.lagging = True
+                if metrics.enabled():
+                    metrics.ws_clients_lagging.inc(kind=self.group_kind)
+            # past the outbox: a lagging page must still be asked
+            await self._write({"type": "ping"})
+
+    async def _close_dead(self):
+        if metrics.enabled():
+            metrics.ws_clients_closed.inc(kind=self.group_kind, reason="idle")
+        # leave the group now; the disconnect may take a while to arrive from a dead peer
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        self.outbox.clear()
+        await self.close(code=4408)
+
+    def _task_done(self, task):
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error("socket task for %s failed, closing", self.group_name, exc_info=task.exception())
+        asyncio.ensure_future(self._close_broken())
+
+    async def _close_broken(self):
+        for task in self._tasks:
+            task.cancel()
+        if metrics.enabled():
+            metrics.ws_clients_closed.inc(kind=self.group_kind, reason="error")
+        if self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        self.outbox.clear()
+        try:
+            await self.close(code=1011)
+        except Exception:
+            # the socket is most likely what failed; the disconnect cleans up the rest
+            pass
 
     async def broadcast_refresh(self, event):
-        await self.send(text_data=json.dumps({
+        await self.push({
             "type": "refresh",
             "reason": event.get("reason", "update"),
-        }))
+            "reasons": event.get("reasons", []),
+            "ids": event.get("ids", []),
+        })
+
 
-class ModerationConsumer(AsyncWebsocketConsumer):
-    group_name = "moderators"
+class ScreenConsumer(EventConsumer):
+    group_kind = SCREENS
+
+    async def connect(self):
+        if await self.join_event():
+            await self.accept()
+            # after joining the group, so nothing broadcast from here on is missed
+            await self.send_initial_state()
+
+    async def send_initial_state(self):
+        since = self.since()
+        if since is not None:
+            version = await acurrent_version(self.event.id)
+            changes = await sync_to_async(replay.missed)(self.event.id, since, version) if since <= version else None
+            if changes is not None:
+                if changes:
+                    await self._write_text(json.dumps({"type": "delta", "changes": changes}), "delta")
+                return
+        snap = await approved_snapshot(self.event, _conf("QA_SCREEN_WINDOW", 20), ranked=True)
+        # the cached approved.json?order=votes body, as is
+        await self._write_text('{"type": "snapshot", "data": ' + snap.body.decode() + "}", "snapshot")
+
+    async def broadcast_delta(self, event):
+        # versioned changes; the client applies them in order and resyncs on a gap
+        changes = event.get("changes", [])
+        await self.push({
+            "type": "delta",
+            "changes": changes,
+        })
+
+    def delivered(self, payload):
+        if payload["type"] != "delta":
+            return
+        now = time.time()
+        for change in payload["changes"]:
+            if change.get("action") == "approve" and "committed_at" in change:
+                metrics.approval_delivery_seconds.observe(now - change["committed_at"])
+
+
+class ModerationConsumer(EventConsumer):
+    group_kind = MODERATORS
 
     async def connect(self):
         # auth check: only staff can connect
@@ -27,14 +240,19 @@ class ModerationConsumer(AsyncWebsocketConsumer):
             await self.close(code=4403)
             return
 
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+        if await self.join_event():
+            await self.accept()
+            # first page of pending.json; moderation has no versions to resume from
+            payload = await pending_payload(self.event, _conf("QA_MODERATION_PAGE_SIZE", 100))
+            await self._write_text(json.dumps({"type": "snapshot", "data": payload}, cls=DjangoJSONEncoder), "snapshot")
 
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
-
-    async def broadcast_refresh(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "refresh",
-            "reason": event.get("reason", "update"),
-        }))
+    async def broadcast_progress(self, event):
+        # running bulk moderation (qa.moderation.bulk_moderate)
+        await self.push({
+            "type": "progress",
+            "operation": event.get("operation"),
+            "action": event.get("action"),
+            "done": event.get("done", 0),
+            "total": event.get("total", 0),
+            "finished": event.get("finished", False),
+        })
@@ -0,0 +1,284 @@
+import heapq
+import logging
+import re
+import struct
+import threading
+import unicodedata
+import zlib
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Near-duplicate detection. Each question gets a bottom-k MinHash sketch: the
+# SKETCH_SIZE smallest CRC32 hashes of its character 3-shingles (after folding
+# case, accents and punctuation). Two sketches estimate the Jaccard similarity of
+# the shingle sets; rewordings of one question land around 0.5-0.7, unrelated
+# questions below 0.2.
+#
+# The index maps sketch hashes to the cluster roots (questions that are not a
+# duplicate themselves) of an event that are pending or approved, so a lookup only
+# compares against the few roots sharing a hash. A new question that is close
+# enough to one of them gets duplicate_of = that root; otherwise it becomes a
+# root. Computing a sketch takes well under a millisecond.
+
+SKETCH_SIZE = 32
+SHINGLE_SIZE = 3
+# roots sharing fewer hashes than this with the new question are not compared
+MIN_SHARED = 2
+MAX_CANDIDATES = 20
+
+_punctuation = re.compile(r"[^\w\s]+")
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def enabled() -> bool:
+    return _conf("QA_DEDUP_ENABLED", True)
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_punctuation.sub(" ", text).split())
+
+
+def sketch(text: str):
+    """Sorted tuple of the SKETCH_SIZE smallest shingle hashes of text."""
+    s = normalize(text)
+    hashes = {
+        zlib.crc32(s[i:i + SHINGLE_SIZE].encode())
+        for i in range(max(1, len(s) - SHINGLE_SIZE + 1))
+    }
+    return tuple(sorted(heapq.nsmallest(SKETCH_SIZE, hashes)))
+
+
+def similarity(a, b) -> float:
+    """Estimated Jaccard similarity of the texts behind two sketches."""
+    if not a or not b:
+        return 0.0
+    both = set(a) & set(b)
+    union = heapq.nsmallest(SKETCH_SIZE, set(a) | set(b))
+    return sum(1 for h in union if h in both) / len(union)
+
+
+def _pack(sk) -> bytes:
+    return struct.pack(f"<{len(sk)}I", *sk)
+
+
+def _unpack(raw: bytes):
+    return struct.unpack(f"<{len(raw) // 4}I", raw)
+
+
+def _top(counts):
+    return [pk for pk, n in counts.most_common(MAX_CANDIDATES) if n >= MIN_SHARED]
+
+
+class LocalDedupIndex:
+    """In-process index — for tests and single-worker dev."""
+
+    def __init__(self):
+        # event_id -> {hash: {root ids}}, event_id -> {root id: sketch}
+        self._buckets = defaultdict(lambda: defaultdict(set))
+        self._sketches = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def candidates(self, event_id, sk):
+        with self._lock:
+            buckets = self._buckets[event_id]
+            counts = Counter(pk for h in sk for pk in buckets.get(h, ()))
+            sketches = self._sketches[event_id]
+            return {pk: sketches[pk] for pk in _top(counts)}
+
+    def add(self, event_id, pk, sk):
+        with self._lock:
+            buckets = self._buckets[event_id]
+            for h in sk:
+                buckets[h].add(pk)
+            self._sketches[event_id][pk] = sk
+
+    def remove(self, event_id, ids):
+        with self._lock:
+            buckets = self._buckets[event_id]
+            for pk in ids:
+                for h in self._sketches[event_id].pop(pk, ()):
+                    buckets[h].discard(pk)
+
+    def clear(self, event_id):
+        with self._lock:
+            self._buckets.pop(event_id, None)
+            self._sketches.pop(event_id, None)
+
+
+class RedisDedupIndex:
+    """
+    Shared across workers: a set of root ids per (event, hash) and a hash of
+    id -> packed sketch per event. A lookup is two pipelined round trips.
+    Keys expire QA_DEDUP_TTL seconds after the event's last new root.
+    """
+
+    def __init__(self, client, prefix="qa:dedup:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _bucket(self, event_id, h):
+        return f"{self.prefix}{event_id}:h:{h}"
+
+    def _sketches(self, event_id):
+        return f"{self.prefix}{event_id}:sk"
+
+    def candidates(self, event_id, sk):
+        pipe = self.client.pipeline(transaction=False)
+        for h in sk:
+            pipe.smembers(self._bucket(event_id, h))
+        counts = Counter(int(pk) for members in pipe.execute() for pk in members)
+        ids = _top(counts)
+        if not ids:
+            return {}
+        raw = self.client.hmget(self._sketches(event_id), ids)
+        return {pk: _unpack(r) for pk, r in zip(ids, raw) if r is not None}
+
+    def add(self, event_id, pk, sk):
+        ttl = _conf("QA_DEDUP_TTL", 2 * 86400)
+        pipe = self.client.pipeline(transaction=False)
+        for h in sk:
+            key = self._bucket(event_id, h)
+            pipe.sadd(key, pk)
+            pipe.expire(key, ttl)
+        pipe.hset(self._sketches(event_id), pk, _pack(sk))
+        pipe.expire(self._sketches(event_id), ttl)
+        pipe.execute()
+
+    def remove(self, event_id, ids):
+        ids = list(ids)
+        raw = self.client.hmget(self._sketches(event_id), ids)
+        pipe = self.client.pipeline(transaction=False)
+        for pk, r in zip(ids, raw):
+            if r is None:
+                continue
+            for h in _unpack(r):
+                pipe.srem(self._bucket(event_id, h), pk)
+            pipe.hdel(self._sketches(event_id), pk)
+        pipe.execute()
+
+    def clear(self, event_id):
+        keys = list(self.client.scan_iter(f"{self.prefix}{event_id}:*", count=1000))
+        for i in range(0, len(keys), 1000):
+            self.client.delete(*keys[i:i + 1000])
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if _conf("QA_DEDUP_BACKEND", "redis") == "local":
+                    _index = LocalDedupIndex()
+                else:
+                    from .redis_client import get_redis
+                    _index = RedisDedupIndex(get_redis())
+    return _index
+
+
+# The index is an optimization: if it can't be reached a question is simply
+# stored on its own, never rejected.
+
+def find_root(event_id, sk):
+    """Id of the most similar root at or above QA_DEDUP_THRESHOLD, or None."""
+    if not enabled():
+        return None
+    threshold = _conf("QA_DEDUP_THRESHOLD", 0.5)
+    try:
+        candidates = get_index().candidates(event_id, sk)
+    except Exception:
+        logger.exception("dedup lookup failed")
+        return None
+    best, best_score = None, threshold
+    for pk, other in candidates.items():
+        score = similarity(sk, other)
+        if score >= best_score:
+            best, best_score = pk, score
+    return best
+
+
+def remember(event_id, pk, sk):
+    """Make question pk a root others can be folded into."""
+    if not enabled():
+        return
+    try:
+        get_index().add(event_id, pk, sk)
+    except Exception:
+        logger.exception("dedup index update failed")
+
+
+def forget(event_id, ids):
+    """Drop questions that are no longer pending/approved (rejected, deleted)."""
+    if not enabled():
+        return
+    try:
+        get_index().remove(event_id, ids)
+    except Exception:
+        logger.exception("dedup index update failed")
+
+
+def save_new_question(obj):
+    """Save a new question, as a duplicate of its cluster's root if it has one."""
+    sk = sketch(obj.question)
+    obj.duplicate_of_id = find_root(obj.event_id, sk)
+    obj.save()
+    if obj.duplicate_of_id is None:
+        remember(obj.event_id, obj.pk, sk)
+    return obj
+
+
+def fold_batch(questions):
+    """
+    Find the cluster root of each unsaved question in a batch (same event or not).
+    Sets duplicate_of_id where the root already exists. Returns ({index in batch:
+    index of its root in the batch} for roots that are new themselves, and the
+    sketches), so the caller can link and remember them once they have ids.
+    """
+    threshold = _conf("QA_DEDUP_THRESHOLD", 0.5)
+    within = {}
+    new_roots = defaultdict(list)  # event_id -> [(index, sketch)]
+    sketches = []
+    for i, q in enumerate(questions):
+        sk = sketch(q.question)
+        sketches.append(sk)
+        q.duplicate_of_id = find_root(q.event_id, sk)
+        if q.duplicate_of_id is not None or not enabled():
+            continue
+        match = max(new_roots[q.event_id], key=lambda r: similarity(sk, r[1]), default=None)
+        if match is not None and similarity(sk, match[1]) >= threshold:
+            within[i] = match[0]
+        else:
+            new_roots[q.event_id].append((i, sk))
+    return within, sketches
+
+
+def rebuild(event_id):
+    """Re-index an event's pending/approved roots from the database."""
+    from .models import Question
+
+    index = get_index()
+    index.clear(event_id)
+    rows = (
+        Question.objects.filter(
+            event_id=event_id, duplicate_of__isnull=True,
+            status__in=[Question.STATUS_PENDING, Question.STATUS_APPROVED],
+        )
+        .values_list("pk", "question")
+        .iterator(chunk_size=2000)
+    )
+    n = 0
+    for pk, text in rows:
+        index.add(event_id, pk, sketch(text))
+        n += 1
+    return n
@@ -0,0 +1,100 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Question
+
+# Post-event export. Rows are read with .iterator()/.aiterator() (a server-side
+# cursor on PostgreSQL) as plain dicts and written out one at a time, so memory
+# stays flat however many questions an event collected.
+
+# column -> lookup
+EXPORT_COLUMNS = {
+    "id": "id",
+    "event": "event__slug",
+    "status": "status",
+    "created_at": "created_at",
+    "name": "name",
+    "question": "question",
+    "votes": "votes",
+    "duplicate_of": "duplicate_of",
+}
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+_encoder = DjangoJSONEncoder()
+
+
+def _chunk_size():
+    return getattr(settings, "QA_EXPORT_CHUNK_SIZE", 2000)
+
+
+def export_rows(filters):
+    """Questions matching parse_filters() output, oldest first, as dicts of EXPORT_COLUMNS lookups."""
+    # .values() rather than .values_list(): only its iterable is lazy enough for aiterator()
+    return Question.objects.filter(**filters).order_by("pk").values(*EXPORT_COLUMNS.values())
+
+
+def iter_rows(filters):
+    return export_rows(filters).iterator(chunk_size=_chunk_size())
+
+
+def aiter_rows(filters):
+    return export_rows(filters).aiterator(chunk_size=_chunk_size())
+
+
+class _Line:
+    # csv.writer target that hands back what it was given instead of storing it
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    # audience text must not turn into a formula when the file is opened in a spreadsheet
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + value
+    if hasattr(value, "isoformat"):
+        return _encoder.default(value)  # same format as the JSON endpoints
+    return value
+
+
+class CsvRenderer:
+    def __init__(self):
+        self._writer = csv.writer(_Line())
+
+    def header(self):
+        return self._writer.writerow(EXPORT_COLUMNS)
+
+    def row(self, row):
+        return self._writer.writerow([_cell(row[lookup]) for lookup in EXPORT_COLUMNS.values()])
+
+
+class NdjsonRenderer:
+    def header(self):
+        return ""
+
+    def row(self, row):
+        data = {column: row[lookup] for column, lookup in EXPORT_COLUMNS.items()}
+        return json.dumps(data, default=_encoder.default) + "\n"
+
+
+RENDERERS = {"csv": CsvRenderer, "ndjson": NdjsonRenderer}
+
+
+def render_lines(rows, fmt):
+    renderer = RENDERERS[fmt]()
+    yield renderer.header()
+    for row in rows:
+        yield renderer.row(row)
+
+
+async def arender_lines(rows, fmt):
+    renderer = RENDERERS[fmt]()
+    yield renderer.header()
+    async for row in rows:
+        yield renderer.row(row)
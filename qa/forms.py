@@ -6,10 +6,10 @@ class AskForm(forms.ModelForm):
         model = Question
         fields = ["name", "question"]
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, app_settings=None, **kwargs):
         super().__init__(*args, **kwargs)
-        settings = AppSetting.get_solo()
-        max_len = settings.max_question_length
+        self.app_settings = app_settings or AppSetting.get_solo()
+        max_len = self.app_settings.max_question_length
 
         self.fields["name"].required = False
         self.fields["name"].widget = forms.TextInput(attrs={
@@ -29,7 +29,7 @@ class AskForm(forms.ModelForm):
 
     def clean_question(self):
         q = (self.cleaned_data.get("question") or "").strip()
-        settings = AppSetting.get_solo()
+        settings = self.app_settings
 
         if not settings.submissions_enabled:
             raise forms.ValidationError("Submissions are currently disabled.")
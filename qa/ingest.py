@@ -0,0 +1,367 @@
+import json
+import logging
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+
+from . import dedup
+from .models import Event, Question
+from .realtime import broadcast_transition
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "qa:ingest"
+STREAM_GROUP = "qa-ingest"
+STATS_KEY = "qa:ingest:stats"
+DEAD_KEY = "qa:ingest:dead"
+
+# the database itself is unreachable: nothing in the batch is at fault
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+class IngestBackpressure(Exception):
+    """The queue is over QA_INGEST_MAX_BACKLOG; the submission was not accepted."""
+
+
+# counters kept by the queue, so web processes (enqueued/rejected) and workers
+# (the rest) add up to one set for the whole deployment
+STATS = {
+    "enqueued": 0,
+    "rejected": 0,
+    "ingested": 0,
+    "dead_lettered": 0,
+    "batches": 0,
+    "last_batch_size": 0,
+    "last_batch_ms": 0.0,
+}
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+# With QA_INGEST_MODE = "queue", ask_view only validates and pushes the question
+# onto a queue (a Redis stream, or an in-process deque for dev/tests). A worker
+# (`manage.py qa_ingest`, or a thread for the local backend) drains it in batches.
+def queue_mode() -> bool:
+    return _conf("QA_INGEST_MODE", "direct") == "queue"
+
+
+class LocalIngestQueue:
+    """In-process stand-in for the Redis stream (single worker, dev and tests)."""
+
+    def __init__(self):
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._next_id = 0
+        self._stats = dict(STATS)
+        self.dead = []
+
+    def push(self, item: dict):
+        with self._cond:
+            self._next_id += 1
+            self._items.append((str(self._next_id), item))
+            self._cond.notify()
+
+    def read(self, count: int, block_ms: int):
+        with self._cond:
+            if not self._items:
+                self._cond.wait(block_ms / 1000)
+            batch = []
+            while self._items and len(batch) < count:
+                batch.append(self._items.popleft())
+            return batch
+
+    def ack(self, ids):
+        pass
+
+    def requeue(self, batch):
+        """Put a batch that could not be written back at the head of the queue."""
+        with self._cond:
+            self._items.extendleft(reversed(batch))
+            self._cond.notify()
+
+    def dead_letter(self, entries):
+        with self._cond:
+            self.dead.extend(entries)
+
+    def length(self) -> int:
+        return len(self._items)
+
+    def update_stats(self, incr=None, **values):
+        with self._cond:
+            for name, n in (incr or {}).items():
+                self._stats[name] += n
+            self._stats.update(values)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return dict(self._stats)
+
+
+class RedisIngestQueue:
+    """Redis stream with a consumer group, so several workers can share the load."""
+
+    def __init__(self, client, consumer=None):
+        self.client = client
+        # stable across restarts, so a restarted worker finds what it had read
+        self.consumer = consumer or _conf("QA_INGEST_CONSUMER", "") or socket.gethostname()
+        self._group_ready = False
+        self._replay_pending = True
+        self._claimed_at = None
+
+    def _ensure_group(self):
+        if self._group_ready:
+            return
+        import redis
+        try:
+            self.client.xgroup_create(STREAM_KEY, STREAM_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def push(self, item: dict):
+        self.client.xadd(STREAM_KEY, {"q": json.dumps(item)})
+
+    def _claim_idle(self):
+        """Take over entries another consumer read but never acked (it is gone)."""
+        idle_ms = _conf("QA_INGEST_CLAIM_IDLE_MS", 60000)
+        now = time.monotonic()
+        if self._claimed_at is not None and now - self._claimed_at < idle_ms / 1000:
+            return
+        self._claimed_at = now
+        cursor, claimed = "0-0", 0
+        while True:
+            resp = self.client.xautoclaim(
+                STREAM_KEY, STREAM_GROUP, self.consumer, idle_ms, start_id=cursor, count=100,
+            )
+            cursor, entries = resp[0], resp[1]
+            claimed += len(entries)
+            if cursor in (b"0-0", "0-0"):
+                break
+        if claimed:
+            logger.warning("claimed %d unacked ingest entries from other consumers", claimed)
+            self._replay_pending = True
+
+    def read(self, count: int, block_ms: int):
+        self._ensure_group()
+        self._claim_idle()
+        # after a restart (or a claim), first re-deliver what this consumer had
+        # read but not acked
+        start = "0" if self._replay_pending else ">"
+        resp = self.client.xreadgroup(
+            STREAM_GROUP, self.consumer, {STREAM_KEY: start},
+            count=count, block=None if self._replay_pending else block_ms,
+        )
+        entries = resp[0][1] if resp else []
+        if self._replay_pending and len(entries) < count:
+            self._replay_pending = False
+        return [
+            (entry_id.decode(), json.loads(fields[b"q"]))
+            for entry_id, fields in entries
+        ]
+
+    def ack(self, ids):
+        if ids:
+            self.client.xack(STREAM_KEY, STREAM_GROUP, *ids)
+            self.client.xdel(STREAM_KEY, *ids)
+
+    def requeue(self, batch):
+        # still pending (never acked): read them again from the start of our PEL
+        self._replay_pending = True
+
+    def dead_letter(self, entries):
+        # kept for inspection / replay by hand; the caller acks them
+        pipe = self.client.pipeline(transaction=False)
+        for entry_id, item, error in entries:
+            pipe.xadd(DEAD_KEY, {"id": entry_id, "q": json.dumps(item), "error": error})
+        pipe.execute()
+
+    def length(self) -> int:
+        return self.client.xlen(STREAM_KEY)
+
+    def update_stats(self, incr=None, **values):
+        pipe = self.client.pipeline(transaction=False)
+        for name, n in (incr or {}).items():
+            pipe.hincrby(STATS_KEY, name, n)
+        if values:
+            pipe.hset(STATS_KEY, mapping=values)
+        pipe.execute()
+
+    def stats(self) -> dict:
+        out = dict(STATS)
+        for name, value in self.client.hgetall(STATS_KEY).items():
+            name = name.decode()
+            if name in out:
+                out[name] = type(out[name])(float(value))
+        return out
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                if _conf("QA_INGEST_BACKEND", "redis") == "local":
+                    _queue = LocalIngestQueue()
+                    # nobody else can drain an in-process queue
+                    IngestWorker(_queue).start()
+                else:
+                    from .redis_client import get_redis
+                    _queue = RedisIngestQueue(get_redis())
+    return _queue
+
+
+def enqueue_question(event_id, name, question):
+    q = get_queue()
+    if q.length() >= _conf("QA_INGEST_MAX_BACKLOG", 50000):
+        q.update_stats({"rejected": 1})
+        raise IngestBackpressure()
+    q.push({"event_id": event_id, "name": name or None, "question": question})
+    q.update_stats({"enqueued": 1})
+
+
+class IngestWorker:
+    def __init__(self, queue, batch_size=None, flush_interval=None):
+        self.queue = queue
+        self.batch_size = batch_size or _conf("QA_INGEST_BATCH_SIZE", 200)
+        interval_ms = flush_interval if flush_interval is not None else _conf("QA_INGEST_FLUSH_INTERVAL_MS", 500)
+        self.flush_interval = interval_ms / 1000
+        self.max_retries = _conf("QA_INGEST_MAX_RETRIES", 3)
+        self._failures = 0
+        self._stop = threading.Event()
+
+    def collect(self):
+        """Read until the batch is full or the flush interval has passed."""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            batch.extend(self.queue.read(self.batch_size - len(batch), max(1, int(remaining * 1000))))
+        return batch
+
+    def _insert(self, batch):
+        default_event_id = None
+        questions = []
+        for _, item in batch:
+            event_id = item.get("event_id")
+            if event_id is None:
+                # queued before questions were per event
+                default_event_id = default_event_id or Event.get_default().id
+                event_id = default_event_id
+            questions.append(Question(
+                event_id=event_id, name=item["name"], question=item["question"],
+                status=Question.STATUS_PENDING,
+            ))
+        # near-duplicates of indexed questions are linked now, those of another
+        # question in this batch once it has an id
+        within, sketches = dedup.fold_batch(questions)
+        with transaction.atomic():
+            objs = Question.objects.bulk_create(questions)
+            if within:
+                for i, root in within.items():
+                    objs[i].duplicate_of_id = objs[root].pk
+                Question.objects.bulk_update([objs[i] for i in within], ["duplicate_of"])
+        return objs, sketches
+
+    def _insert_each(self, batch, started):
+        """
+        Write a batch that keeps failing one question at a time; the ones that
+        still fail go to the dead letters and are acked with the rest.
+        """
+        objs, sketches, dead = [], [], []
+        for n, (entry_id, item) in enumerate(batch):
+            try:
+                written, sketch = self._insert([(entry_id, item)])
+            except TRANSIENT_ERRORS:
+                # lost the database halfway: keep what is done, retry the rest
+                self._finish(batch[:n], objs, sketches, dead, started)
+                self.queue.requeue(batch[n:])
+                raise
+            except Exception as e:
+                logger.warning("ingest: dead-lettering entry %s: %r", entry_id, e)
+                dead.append((entry_id, item, repr(e)))
+            else:
+                objs.extend(written)
+                sketches.extend(sketch)
+        return self._finish(batch, objs, sketches, dead, started)
+
+    def _finish(self, batch, objs, sketches, dead, started):
+        for i, o in enumerate(objs):
+            if o.duplicate_of_id is None and o.pk is not None:
+                dedup.remember(o.event_id, o.pk, sketches[i])
+        if dead:
+            self.queue.dead_letter(dead)
+        self.queue.ack([entry_id for entry_id, _ in batch])
+
+        # bulk_create sends no post_save: one moderation refresh per event for the
+        # whole batch. New questions are pending, which screens never show.
+        ids_by_event = defaultdict(list)
+        for o in objs:
+            if o.pk is not None:
+                ids_by_event[o.event_id].append(o.pk)
+        for event_id, ids in ids_by_event.items():
+            broadcast_transition(event_id, None, Question.STATUS_PENDING, ids, reason="question_ingested")
+
+        self.queue.update_stats(
+            {"ingested": len(objs), "batches": 1, "dead_lettered": len(dead)},
+            last_batch_size=len(objs),
+            last_batch_ms=round((time.monotonic() - started) * 1000, 3),
+        )
+        return objs
+
+    def write(self, batch):
+        if not batch:
+            return []
+        started = time.monotonic()
+        try:
+            objs, sketches = self._insert(batch)
+        except TRANSIENT_ERRORS:
+            # nothing was written, and no question is to blame: retry them all
+            self.queue.requeue(batch)
+            raise
+        except Exception:
+            self._failures += 1
+            if self._failures <= self.max_retries:
+                self.queue.requeue(batch)
+                raise
+            # the same failure every time: find the questions causing it
+            logger.exception("ingest batch failed %d times, writing it one by one", self._failures)
+            self._failures = 0
+            return self._insert_each(batch, started)
+        self._failures = 0
+        return self._finish(batch, objs, sketches, [], started)
+
+    def run_once(self):
+        return self.write(self.collect())
+
+    def run(self):
+        while not self._stop.is_set():
+            close_old_connections()
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("ingest batch failed")
+                time.sleep(self.flush_interval)
+
+    def start(self):
+        threading.Thread(target=self.run, name="qa-ingest", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def backpressure_stats() -> dict:
+    q = get_queue()
+    return {**q.stats(), "backlog": q.length()}
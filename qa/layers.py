@@ -0,0 +1,71 @@
+import asyncio
+import time
+from copy import deepcopy
+
+from channels.layers import InMemoryChannelLayer
+
+# QA_CHANNEL_BACKEND=memory: the channel layer for a single server process (one
+# daphne, tests). A group_send is a loop over the member queues in memory — no
+# Redis round trip at all — but nothing crosses to another process.
+
+# seconds between sweeps for expired messages and group memberships
+CLEAN_INTERVAL = 1.0
+
+
+class InProcessChannelLayer(InMemoryChannelLayer):
+    """
+    InMemoryChannelLayer tuned for big groups, whose queues stay on the server's
+    event loop.
+
+    Upstream sweeps every queue on each receive and copies the message (in a task
+    of its own) for every member on group_send, so one broadcast to n sockets
+    costs O(n²). Here the sweep runs at most once per CLEAN_INTERVAL and a
+    broadcast puts one shared copy on each queue: consumers only read messages.
+
+    Broadcasts come from the coalescer's own loop thread; asyncio queues aren't
+    thread-safe, so those are handed over to the server loop.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop = None
+        self._cleaned_at = 0.0
+
+    def _clean_expired(self):
+        now = time.monotonic()
+        if now - self._cleaned_at < CLEAN_INTERVAL:
+            return
+        self._cleaned_at = now
+        super()._clean_expired()
+
+    async def receive(self, channel):
+        # consumers receive on the server loop
+        self._loop = asyncio.get_running_loop()
+        return await super().receive(channel)
+
+    async def _on_server_loop(self, send, *args):
+        loop = self._loop
+        if loop is None or not loop.is_running() or loop is asyncio.get_running_loop():
+            return await send(*args)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(send(*args), loop))
+
+    async def send(self, channel, message):
+        return await self._on_server_loop(super().send, channel, message)
+
+    async def group_send(self, group, message):
+        return await self._on_server_loop(self._group_send, group, message)
+
+    async def _group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        self._clean_expired()
+
+        item = (time.time() + self.expiry, deepcopy(message))
+        for channel in list(self.groups.get(group, ())):
+            queue = self.channels.setdefault(channel, asyncio.Queue(maxsize=self.get_capacity(channel)))
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # like upstream: a member that can't keep up misses this one
+                pass
+
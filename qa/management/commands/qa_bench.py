@@ -0,0 +1,326 @@
+import asyncio
+import json
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from qa import bench, metrics
+from qa.coalescer import BroadcastCoalescer, set_coalescer
+from qa.models import Question
+from qa.realtime import SCREENS, group_name
+from qa.routing import websocket_urlpatterns
+
+VIEW_ENDPOINTS = [
+    ("GET", "screen/approved.json"),
+    ("GET", "settings.json"),
+    ("GET", "moderation/pending.json"),
+    ("POST", "ask/"),
+]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the hot paths in-process (in-memory channel layer and cache by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=["views", "pipeline", "db", "fanout"])
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--approved", type=int, default=200, help="Approved rows to seed.")
+        parser.add_argument("--pending", type=int, default=200, help="Pending rows to seed.")
+        parser.add_argument("--phones", type=int, default=1000,
+                            help="pipeline: audience submissions (one per simulated phone).")
+        parser.add_argument("--screens", type=int, default=30, help="pipeline: screen websocket clients.")
+        parser.add_argument("--moderators", type=int, default=2, help="pipeline: moderation websocket clients.")
+        parser.add_argument("--batch", type=int, default=50, help="pipeline: questions per moderation_action.")
+        parser.add_argument("--consumers", default="10,100,1000",
+                            help="fanout: comma-separated group sizes to broadcast to.")
+        parser.add_argument("--sends", type=int, default=50, help="fanout: broadcasts per group size.")
+        parser.add_argument("--real-backends", action="store_true",
+                            help="Use the configured Redis cache/channel layer instead of in-memory ones.")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+        parser.add_argument("--save-baseline", metavar="PATH", help="Write the results to PATH.")
+        parser.add_argument("--baseline", metavar="PATH",
+                            help="Compare against results saved with --save-baseline; fail on regressions.")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="Allowed slowdown against the baseline (0.2 = 20%%).")
+
+    def handle(self, *args, **options):
+        overrides = {
+            "ROOT_URLCONF": "qa.bench",
+            "ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "testserver"],
+            **bench.BENCH_SETTINGS,
+        }
+        if not options["real_backends"]:
+            overrides.update(bench.MEMORY_BACKENDS)
+
+        with override_settings(**overrides):
+            # broadcasts of this run (the cleanup's too) go out before the overridden
+            # channel layer is swapped back, not later to the configured one
+            window = getattr(settings, "QA_BROADCAST_WINDOW_MS", 250) / 1000
+            coalescer = BroadcastCoalescer(window)
+            previous = set_coalescer(coalescer)
+            # everything happens in a throwaway event, deleted afterwards
+            self.event = bench.create_event()
+            try:
+                bench.seed_questions(options["approved"], options["pending"], self.event)
+                results = getattr(self, f"run_{options['scenario']}")(options)
+            except bench.BenchError as e:
+                raise CommandError(f"benchmark request failed: {e}")
+            finally:
+                bench.drop_event(self.event)
+                coalescer.close()
+                set_coalescer(previous)
+
+        if options["save_baseline"]:
+            with open(options["save_baseline"], "w") as f:
+                json.dump(results, f, indent=2)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.print_results(results)
+
+        failures = bench.budget_failures(results)
+        for failure in failures:
+            self.stderr.write(f"QUERY BUDGET {failure}")
+        if failures:
+            raise CommandError(f"{len(failures)} endpoint(s) failed their query budget")
+
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                regressions = bench.compare_to_baseline(results, json.load(f), options["tolerance"])
+            for name, metric, old, new, change in regressions:
+                self.stderr.write(f"REGRESSION {name} {metric}: {old} -> {new} ({change:+.0%})")
+            if regressions:
+                raise CommandError(f"{len(regressions)} metric(s) regressed beyond {options['tolerance']:.0%}")
+            self.stdout.write("No regressions against the baseline.")
+
+    def url(self, path):
+        return f"/e/{self.event.slug}/{path}"
+
+    def create_staff(self):
+        return get_user_model().objects.create(username=f"qa-bench-{uuid.uuid4().hex[:12]}", is_staff=True)
+
+    def print_results(self, results):
+        for name, row in results.items():
+            if "p50_ms" in row:
+                line = f"{name:<40} n={row['n']:<6} p50={row['p50_ms']:>8.2f}ms p99={row['p99_ms']:>8.2f}ms"
+                if "rps" in row:
+                    line += f"  {row['rps']:>8.1f} req/s"
+                extra = {k: v for k, v in row.items() if k not in ("n", "p50_ms", "p99_ms", "mean_ms", "rps")}
+            else:
+                line, extra = f"{name:<40}", row
+            self.stdout.write(line + "".join(f"  {k}={v}" for k, v in extra.items()))
+
+    def run_views(self, options):
+        """Each endpoint, async view vs the same view run sync, under the same load."""
+        staff = self.create_staff()
+        results = {}
+
+        async def measure(method, url):
+            client = AsyncClient()
+            await client.aforce_login(staff)
+
+            async def call(i):
+                # a distinct client IP per request, like separate phones
+                extra = {"REMOTE_ADDR": bench.phone_ip(i)}
+                if method == "POST":
+                    response = await AsyncClient().post(
+                        url, {"question": f"Bench question {i}", "name": bench.BENCH_NAME}, **extra,
+                    )
+                else:
+                    response = await client.get(url, **extra)
+                bench.expect_ok(response.status_code, method, url)
+
+            return await bench.run_concurrent(call, options["requests"], options["concurrency"])
+
+        try:
+            for method, url in VIEW_ENDPOINTS:
+                for label, prefix in (("async", "/"), ("sync", "/bench/sync/")):
+                    results[f"{method} /{url} [{label}]"] = async_to_sync(measure)(method, prefix + self.url(url)[1:])
+        finally:
+            staff.delete()
+        return results
+
+    def run_db(self, options):
+        """
+        POST /ask/ through the ASGI handler at rising concurrency: latency, and the
+        database connections it took (threads that connected, connection setups,
+        what the server sees afterwards, and the pool's counters when pooled).
+        """
+        app = ASGIHandler()
+        results = {}
+        for concurrency in sorted({1, max(1, options["concurrency"] // 5), options["concurrency"]}):
+            async def submit(i):
+                status = await bench.asgi_post(
+                    app, self.url("ask/"), {"question": f"Bench db {i} {uuid.uuid4().hex}", "name": bench.BENCH_NAME},
+                    bench.phone_ip(i),
+                )
+                bench.expect_ok(status, "POST", self.url("ask/"))
+
+            pool_before = metrics.pool_stats().get("default", {})
+            with bench.ConnectionTracker() as tracker:
+                row = async_to_sync(bench.run_concurrent)(submit, options["requests"], concurrency)
+            row.update(tracker.counts())
+            server = bench.server_connections()
+            if server is not None:
+                row["server_connections"] = server
+            pool_after = metrics.pool_stats().get("default")
+            if pool_after:
+                row["pool_size"] = pool_after.get("pool_size", 0)
+                for key in ("requests_queued", "requests_wait_ms", "requests_errors", "connections_num"):
+                    row[f"pool_{key}"] = pool_after.get(key, 0) - pool_before.get(key, 0)
+            results[f"POST /ask/ [asgi c={concurrency}]"] = row
+        return results
+
+    def run_fanout(self, options):
+        """Broadcast latency through the channel layer to groups of 10, 100, 1000... members."""
+        try:
+            sizes = [int(n) for n in options["consumers"].split(",")]
+        except ValueError:
+            raise CommandError("--consumers takes comma-separated numbers")
+        layer = get_channel_layer()
+        backend = f"{type(layer).__module__}.{type(layer).__name__}"
+        self.stderr.write(f"channel layer: {backend}")
+        return {
+            f"broadcast x{n} consumers": async_to_sync(bench.measure_broadcast)(layer, n, options["sends"])
+            for n in sizes
+        }
+
+    def run_pipeline(self, options):
+        """
+        submit -> moderate -> screen, end to end: phones POST /ask/ while screens and
+        moderators hold websockets open, then moderation_action approves the new
+        questions in batches and we time how long each takes to reach every screen.
+        """
+        staff = self.create_staff()
+        try:
+            results = self.pipeline_queries(staff)
+            results.update(async_to_sync(self.pipeline)(options, staff))
+        finally:
+            staff.delete()
+        return results
+
+    def pipeline_queries(self, staff):
+        """DB queries per request on the pipeline's endpoints (sequential sample)."""
+        client = Client()
+        client.force_login(staff)
+        pending = list(
+            Question.objects.filter(event=self.event, status=Question.STATUS_PENDING)
+            .values_list("pk", flat=True)[:11]
+        )
+        if not pending:
+            raise bench.BenchError("no pending questions to moderate (seed some with --pending)")
+        return {
+            "queries POST /ask/": {"queries": bench.count_queries(
+                Client(), "POST", self.url("ask/"),
+                lambda i: {"question": f"Bench query count {i}", "name": bench.BENCH_NAME},
+                REMOTE_ADDR="10.255.0.1",
+            )},
+            "queries GET /screen/approved.json": {"queries": bench.count_queries(
+                client, "GET", self.url("screen/approved.json"),
+            )},
+            "queries GET /moderation/pending.json": {"queries": bench.count_queries(
+                client, "GET", self.url("moderation/pending.json"),
+            )},
+            "queries POST /moderation/action/": {"queries": bench.count_queries(
+                client, "POST", self.url("moderation/action/"),
+                lambda i: {"action": "approve", "ids": str(pending[i % len(pending)])},
+            )},
+        }
+
+    async def pipeline(self, options, staff):
+        results = {}
+        app = URLRouter(websocket_urlpatterns)
+        # broadcasts go out on this loop, where the websocket clients read them
+        window = getattr(settings, "QA_BROADCAST_WINDOW_MS", 250) / 1000
+        coalescer = BroadcastCoalescer(window, loop=asyncio.get_running_loop())
+        previous = set_coalescer(coalescer)
+
+        screens, moderators = [], []
+        try:
+            for _ in range(options["screens"]):
+                screens.append(await self.open_socket(app, f"/ws/e/{self.event.slug}/screen/"))
+            for _ in range(options["moderators"]):
+                moderators.append(await self.open_socket(app, f"/ws/e/{self.event.slug}/moderation/", user=staff))
+
+            # 1. audience submissions, one fresh client (no device cookie) per phone;
+            # the random tail keeps them from being folded as near-duplicates
+            async def submit(i):
+                response = await AsyncClient().post(
+                    self.url("ask/"), {"question": f"Bench pipeline {i} {uuid.uuid4().hex}", "name": bench.BENCH_NAME},
+                    REMOTE_ADDR=bench.phone_ip(i),
+                )
+                bench.expect_ok(response.status_code, "POST", self.url("ask/"))
+
+            results["submit POST /ask/"] = await bench.run_concurrent(
+                submit, options["phones"], options["concurrency"],
+            )
+
+            # 2. moderators approve the new questions in batches
+            ids = [pk async for pk in Question.objects.filter(
+                event=self.event, question__startswith="Bench pipeline",
+                status=Question.STATUS_PENDING,
+            ).order_by("pk").values_list("pk", flat=True)]
+            if not ids:
+                raise bench.BenchError("none of the submissions reached the moderation queue")
+            batches = [ids[i:i + options["batch"]] for i in range(0, len(ids), options["batch"])]
+            moderator = AsyncClient()
+            await moderator.aforce_login(staff)
+            approved_at = {}
+
+            async def approve(i):
+                batch = batches[i]
+                started = time.perf_counter()
+                response = await moderator.post(
+                    self.url("moderation/action/"), {"action": "approve", "ids": ",".join(map(str, batch))},
+                )
+                bench.expect_ok(response.status_code, "POST", self.url("moderation/action/"))
+                for pk in batch:
+                    approved_at[pk] = started
+
+            results["moderate POST /moderation/action/"] = await bench.run_concurrent(
+                approve, len(batches), min(options["concurrency"], 4),
+            )
+
+            # 3. approval -> screen: every approved id on every screen
+            complete = await bench.wait_for_arrival(screens, ids, timeout=60)
+            latencies = [w.arrived[pk] - approved_at[pk] for w in screens for pk in ids if pk in w.arrived]
+            row = bench.summarize(latencies, 0)
+            row.pop("rps")
+            row["complete"] = complete
+            row["screen_messages"] = sum(w.messages for w in screens)
+            row["moderator_messages"] = sum(w.messages for w in moderators)
+            results["propagation approve -> screen"] = row
+            results["coalescer"] = dict(coalescer.stats)
+
+            # 4. raw channel-layer fan-out to the screens group
+            results[f"fanout group_send x{len(screens)} screens"] = await bench.measure_fanout(
+                get_channel_layer(), group_name(SCREENS, self.event.id), 200, len(screens),
+            )
+        finally:
+            for watcher in screens + moderators:
+                await watcher.stop()
+            set_coalescer(previous)
+        return results
+
+    async def open_socket(self, app, path, user=None):
+        communicator = WebsocketCommunicator(app, path)
+        if user is not None:
+            communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        if not connected:
+            raise CommandError(f"websocket {path} refused the connection")
+        watcher = bench.SocketWatcher(communicator)
+        watcher.start()
+        return watcher
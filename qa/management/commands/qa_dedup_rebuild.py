@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from qa import dedup
+from qa.models import Event
+
+
+class Command(BaseCommand):
+    help = "Rebuild the near-duplicate index from the database (e.g. after a Redis flush)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--event", metavar="SLUG", help="Only this event (default: all).")
+
+    def handle(self, *args, **options):
+        events = Event.objects.all()
+        if options["event"]:
+            events = events.filter(slug=options["event"])
+            if not events.exists():
+                raise CommandError(f"No event {options['event']!r}")
+        for event in events:
+            n = dedup.rebuild(event.id)
+            self.stdout.write(f"{event.slug}: indexed {n} question(s).")
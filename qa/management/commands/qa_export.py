@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from qa.export import FORMATS, iter_rows, render_lines
+from qa.models import Event
+from qa.moderation import STATUSES, parse_filters
+
+
+class Command(BaseCommand):
+    help = "Write questions as CSV or NDJSON, streamed from the database (constant memory)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--event", metavar="SLUG", help="Only this event (default: all).")
+        parser.add_argument("--status", choices=STATUSES)
+        parser.add_argument("--after", metavar="WHEN", help="Created at or after (ISO datetime or HH:MM today).")
+        parser.add_argument("--before", metavar="WHEN", help="Created before (ISO datetime or HH:MM today).")
+        parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+        parser.add_argument("-o", "--output", metavar="PATH", help="File to write (default: stdout).")
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_filters({
+                "status": options["status"],
+                "created_after": options["after"],
+                "created_before": options["before"],
+            }, required=False)
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options["event"]:
+            try:
+                filters["event_id"] = Event.objects.get(slug=options["event"]).id
+            except Event.DoesNotExist:
+                raise CommandError(f"No event {options['event']!r}")
+
+        lines = render_lines(iter_rows(filters), options["format"])
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        n = -1  # the header line
+        with open(options["output"], "w", newline="", encoding="utf-8") as out:
+            for line in lines:
+                out.write(line)
+                n += 1
+        self.stderr.write(f"Wrote {n} question(s) to {options['output']}.")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from qa.ingest import IngestWorker, get_queue, backpressure_stats
+
+
+class Command(BaseCommand):
+    help = "Drain queued /ask/ submissions into the database in batches (QA_INGEST_MODE=queue)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--flush-interval-ms", type=int, default=None)
+        parser.add_argument("--once", action="store_true", help="Write a single batch and exit.")
+        parser.add_argument(
+            "--consumer", default=None,
+            help="Redis consumer name (default QA_INGEST_CONSUMER, then the hostname).",
+        )
+
+    def handle(self, *args, **options):
+        queue = get_queue()
+        if options["consumer"] and hasattr(queue, "consumer"):
+            queue.consumer = options["consumer"]
+        worker = IngestWorker(
+            queue,
+            batch_size=options["batch_size"],
+            flush_interval=options["flush_interval_ms"],
+        )
+        if options["once"]:
+            objs = worker.run_once()
+            self.stdout.write(f"Ingested {len(objs)} question(s). {backpressure_stats()}")
+            return
+
+        self.stdout.write(
+            f"Draining ingest queue (batch size {worker.batch_size}, "
+            f"flush every {int(worker.flush_interval * 1000)} ms)"
+        )
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
@@ -0,0 +1,72 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from qa.models import ArchivedQuestion, Event
+from qa.moderation import STATUSES
+from qa.retention import archive_partitions, drop_archived, move_batches, old_questions
+
+
+class Command(BaseCommand):
+    help = (
+        "Move old questions to the archive (archive), delete them outright (purge), "
+        "or delete old archived questions (drop) — in short batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("mode", choices=["archive", "purge", "drop"])
+        parser.add_argument("--older-than", type=int, required=True, metavar="DAYS",
+                            help="Only questions created more than DAYS days ago.")
+        parser.add_argument("--status", action="append", choices=STATUSES,
+                            help="archive/purge: only this status (repeatable; default: all).")
+        parser.add_argument("--event", metavar="SLUG", help="archive/purge: only this event.")
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Rows per transaction (default: QA_RETENTION_BATCH_SIZE).")
+        parser.add_argument("--sleep", type=int, default=0, metavar="MS",
+                            help="Pause between batches, to leave room for live traffic.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would go.")
+
+    def handle(self, *args, **options):
+        if options["older_than"] < 0:
+            raise CommandError("--older-than must not be negative")
+        before = timezone.now() - timedelta(days=options["older_than"])
+        pause = options["sleep"] / 1000
+        mode = options["mode"]
+
+        if mode == "drop":
+            if options["status"] or options["event"]:
+                raise CommandError("drop removes whole months: --status/--event do not apply")
+            if options["dry_run"]:
+                self.stdout.write(f"Partitions to drop: {', '.join(archive_partitions(before)) or 'none'}")
+                n = ArchivedQuestion.objects.filter(created_at__lt=before).count()
+                self.stdout.write(f"Would drop {n} archived question(s).")
+                return
+            total = 0
+            for what, n in drop_archived(before, options["batch_size"], pause):
+                total += n
+                self.stdout.write(f"  {what}: {n}")
+            self.stdout.write(f"Dropped {total} archived question(s).")
+            return
+
+        event_id = None
+        if options["event"]:
+            try:
+                event_id = Event.objects.get(slug=options["event"]).id
+            except Event.DoesNotExist:
+                raise CommandError(f"No event {options['event']!r}")
+        qs = old_questions(before, options["status"], event_id)
+
+        if options["dry_run"]:
+            verb = "archive" if mode == "archive" else "delete"
+            self.stdout.write(f"Would {verb} {qs.count()} question(s).")
+            return
+
+        started, total = time.monotonic(), 0
+        for n in move_batches(qs, archive=mode == "archive", batch_size=options["batch_size"], pause=pause):
+            total += n
+            if n:
+                self.stdout.write(f"  batch: {n} (total {total}, {time.monotonic() - started:.1f}s)")
+        verb = "Archived" if mode == "archive" else "Deleted"
+        self.stdout.write(f"{verb} {total} question(s).")
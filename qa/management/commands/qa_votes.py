@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from qa.votes import VoteFlusher, get_buffer
+
+
+class Command(BaseCommand):
+    help = "Flush buffered audience votes into the database and notify screens (QA_VOTES_BACKEND=redis)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--flush-interval-ms", type=int, default=None)
+        parser.add_argument("--once", action="store_true", help="Flush once and exit.")
+
+    def handle(self, *args, **options):
+        flusher = VoteFlusher(get_buffer(), flush_interval=options["flush_interval_ms"])
+        if options["once"]:
+            totals = flusher.run_once()
+            self.stdout.write(f"Updated {sum(len(c) for c in totals.values())} question(s).")
+            return
+
+        self.stdout.write(f"Flushing votes every {int(flusher.flush_interval * 1000)} ms")
+        try:
+            flusher.run()
+        except KeyboardInterrupt:
+            flusher.stop()
@@ -0,0 +1,251 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Small in-process metrics registry rendered in the Prometheus text format at
+# /metrics/. Every worker process keeps its own numbers.
+#
+# With QA_METRICS_ENABLED off nothing is recorded: the middleware removes itself,
+# the DB query hook is never installed and the other call sites check enabled().
+
+
+def enabled() -> bool:
+    return getattr(settings, "QA_METRICS_ENABLED", False)
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels_text(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels_text(self.label_names, key)} {value}" for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # per-bucket counts (+Inf last), sum, count
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._values.items()]
+        lines = self.header()
+        names = self.label_names + ("le",)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels_text(names, key + (bound,))} {cumulative}")
+            labels = _labels_text(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+REGISTRY = []
+
+# --- HTTP (qa.middleware.MetricsMiddleware) ---
+http_request_seconds = Histogram(
+    "qa_http_request_duration_seconds", "Request latency by URL name.", ["view", "method", "status"],
+)
+http_db_queries = Histogram(
+    "qa_http_db_queries", "DB queries per request by URL name.", ["view"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+http_db_seconds = Histogram(
+    "qa_http_db_duration_seconds", "Time spent in DB queries per request by URL name.", ["view"],
+)
+
+# --- WebSockets (qa.consumers) ---
+ws_connections = Gauge("qa_ws_connections", "Open websocket connections per group.", ["group"])
+ws_messages_sent = Counter("qa_ws_messages_sent_total", "Messages written to websockets.", ["kind", "type"])
+ws_messages_dropped = Counter(
+    "qa_ws_messages_dropped_total", "Messages that could not be delivered.", ["kind", "reason"],
+)
+ws_clients_lagging = Counter(
+    "qa_ws_clients_lagging_total", "Sockets that missed a ping; updates are held back until they answer.", ["kind"],
+)
+ws_clients_closed = Counter(
+    "qa_ws_clients_closed_total", "Sockets the server closed, e.g. silent past QA_WS_IDLE_TIMEOUT.", ["kind", "reason"],
+)
+approval_delivery_seconds = Histogram(
+    "qa_approval_delivery_seconds", "From the approving commit to the delta reaching a screen socket.",
+)
+
+# --- Broadcasts (qa.realtime / qa.coalescer) ---
+broadcasts = Counter("qa_broadcasts_total", "Broadcasts submitted, before coalescing.", ["kind", "type"])
+group_send_seconds = Histogram("qa_group_send_duration_seconds", "Channel-layer group_send time.", ["kind"])
+
+# --- Database ---
+db_connects = Counter(
+    "qa_db_connects_total",
+    "Database connections set up for a thread: new server connections, or checkouts with a pool.", ["alias"],
+)
+
+# --- Votes (qa.votes) ---
+votes = Counter("qa_votes_total", "Upvotes received; repeats from the same device aren't counted.", ["outcome"])
+
+
+def group_kind(group: str) -> str:
+    """"screens.12" -> "screens"."""
+    return group.split(".", 1)[0]
+
+
+# --- DB query accounting ---
+# The active request's counters. A ContextVar follows the request into
+# sync_to_async threads, where async views run their ORM calls.
+_request_stats = ContextVar("qa_request_db_stats", default=None)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    # connection_created receiver; connected in QaConfig.ready() when enabled.
+    # With a pool it fires whenever the pool hands a connection to a thread.
+    db_connects.inc(alias=connection.alias)
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def start_request():
+    stats = [0, 0.0]
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token):
+    _request_stats.reset(token)
+
+
+# psycopg_pool's own counters (ConnectionPool.get_stats()), per database alias
+POOL_STATS = {
+    "pool_size": ("gauge", "Connections the pool holds, in use or idle."),
+    "pool_available": ("gauge", "Idle connections ready to hand out."),
+    "requests_waiting": ("gauge", "Requests waiting for a free connection right now."),
+    "requests_num": ("counter", "Connections requested from the pool."),
+    "requests_queued": ("counter", "Requests that had to wait for a connection."),
+    "requests_wait_ms": ("counter", "Total time spent waiting for a connection (ms)."),
+    "requests_errors": ("counter", "Requests that timed out waiting for a connection."),
+    "connections_num": ("counter", "Connections the pool opened to the server."),
+    "connections_errors": ("counter", "Failed connection attempts."),
+    "connections_lost": ("counter", "Connections found broken by the health check."),
+}
+
+
+def pool_stats() -> dict:
+    """{alias: ConnectionPool.get_stats()} for the databases using a connection pool."""
+    from django.db import connections
+
+    stats = {}
+    for alias in connections:
+        # only the postgresql backend has .pool; the pool isn't opened by looking
+        pool = getattr(connections[alias], "pool", None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
+
+
+def _pool_lines():
+    stats = pool_stats()
+    if not stats:
+        return []
+    lines = []
+    for key, (kind, help_text) in POOL_STATS.items():
+        name = f"qa_db_pool_{key}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{alias="{alias}"}} {s.get(key, 0)}' for alias, s in stats.items()]
+    return lines
+
+
+def render() -> str:
+    from .coalescer import get_coalescer
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+
+    # the coalescer keeps its own totals
+    stats = get_coalescer().stats
+    lines += [
+        "# HELP qa_coalescer_messages_total Broadcast messages through the coalescer.",
+        "# TYPE qa_coalescer_messages_total counter",
+    ]
+    lines += [f'qa_coalescer_messages_total{{outcome="{k}"}} {v}' for k, v in stats.items()]
+    lines += _pool_lines()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:32
+
+import django.db.models.deletion
+from django.core.management.color import no_style
+from django.db import migrations, models
+
+
+def assign_default_event(apps, schema_editor):
+    Event = apps.get_model("qa", "Event")
+    Question = apps.get_model("qa", "Question")
+    AppSetting = apps.get_model("qa", "AppSetting")
+
+    event, _ = Event.objects.get_or_create(slug="main", defaults={"name": "Main event"})
+    Question.objects.filter(event__isnull=True).update(event=event)
+    AppSetting.objects.filter(event__isnull=True).update(event=event)
+
+    # the old singleton was always written with an explicit pk=1, which never
+    # advanced the id sequence; settings for new events are inserted normally
+    connection = schema_editor.connection
+    for sql in connection.ops.sequence_reset_sql(no_style(), [AppSetting]):
+        schema_editor.execute(sql)
+
+    if connection.vendor == "postgresql":
+        # fire the deferred FK checks now, or the ALTER TABLEs below fail with
+        # "pending trigger events"
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0002_rename_qa_question_status_created_idx_qa_question_status_e6886a_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='question',
+            name='qa_question_status_e6886a_idx',
+        ),
+        migrations.AddField(
+            model_name='appsetting',
+            name='event',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='settings', to='qa.event'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='event',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='questions', to='qa.event'),
+        ),
+        migrations.RunPython(assign_default_event, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appsetting',
+            name='event',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='settings', to='qa.event'),
+        ),
+        migrations.AlterField(
+            model_name='question',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='questions', to='qa.event'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['event', 'status', '-created_at'], name='qa_question_event_i_ab07c5_idx'),
+        ),
+    ]
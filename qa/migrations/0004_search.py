@@ -0,0 +1,42 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# PostgreSQL only (other databases fall back to icontains, see qa.search).
+# The tsvector expression must stay identical to qa.search.SearchDocument.
+SEARCH_INDEXES = [
+    (
+        "qa_question_search_idx",
+        "USING gin (to_tsvector('simple'::regconfig, COALESCE(name, '') || ' ' || question))",
+    ),
+    ("qa_question_question_trgm_idx", "USING gin (question gin_trgm_ops)"),
+    ("qa_question_name_trgm_idx", "USING gin (name gin_trgm_ops)"),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, definition in SEARCH_INDEXES:
+        # CONCURRENTLY: don't block question inserts while a big table is indexed
+        schema_editor.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON qa_question {definition}")
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _ in SEARCH_INDEXES:
+        schema_editor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('qa', '0003_events'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0005_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='votes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
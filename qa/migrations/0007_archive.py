@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# On PostgreSQL the archive is a declaratively partitioned table (monthly ranges
+# of created_at; qa.retention creates the partitions as rows arrive). The primary
+# key must contain the partition key, hence (id, created_at) there. Elsewhere it
+# is a plain table, exactly as the model describes it.
+PARTITIONED_TABLE = """
+CREATE TABLE qa_question_archive (
+    id bigint NOT NULL,
+    event_id bigint NOT NULL REFERENCES qa_event (id) DEFERRABLE INITIALLY DEFERRED,
+    name varchar(120) NULL,
+    question text NOT NULL,
+    status varchar(16) NOT NULL,
+    created_at timestamptz NOT NULL,
+    votes integer NOT NULL CHECK (votes >= 0),
+    duplicate_of_id bigint NULL,
+    archived_at timestamptz NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at)
+"""
+PARTITIONED_INDEX = "CREATE INDEX qa_archive_event_created_idx ON qa_question_archive (event_id, created_at)"
+
+
+class CreateArchiveModel(migrations.CreateModel):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        schema_editor.execute(PARTITIONED_TABLE)
+        schema_editor.execute(PARTITIONED_INDEX)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        # drops the partitions with it
+        schema_editor.execute("DROP TABLE qa_question_archive")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0006_votes'),
+    ]
+
+    operations = [
+        CreateArchiveModel(
+            name='ArchivedQuestion',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(blank=True, max_length=120, null=True)),
+                ('question', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=16)),
+                ('created_at', models.DateTimeField()),
+                ('votes', models.PositiveIntegerField(default=0)),
+                ('duplicate_of_id', models.BigIntegerField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_questions', to='qa.event')),
+            ],
+            options={
+                'db_table': 'qa_question_archive',
+                'indexes': [models.Index(fields=['event', 'created_at'], name='qa_archive_event_created_idx')],
+            },
+        ),
+    ]
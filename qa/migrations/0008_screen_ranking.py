@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0007_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['event', 'status', '-votes', '-created_at'], name='qa_question_event_i_c15981_idx'),
+        ),
+    ]
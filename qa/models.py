@@ -1,4 +1,10 @@
-from django.db import models
+import copy
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator, RegexValidator
 
 hex_color = RegexValidator(
@@ -6,6 +12,145 @@ hex_color = RegexValidator(
     message="Enter a valid hex color like #FFFFFF",
 )
 
+
+class Event(models.Model):
+    # One room/session. Questions, settings, channel groups and URLs are all scoped
+    # to an event; the un-prefixed URLs (/screen/, /ask/, ...) serve DEFAULT_SLUG.
+    DEFAULT_SLUG = "main"
+
+    slug = models.SlugField(max_length=64, unique=True)
+    name = models.CharField(max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def cache_key(slug):
+        return f"qa:event:{slug}"
+
+    @classmethod
+    def _from_cache(cls, data):
+        # a detached instance is all callers need: id for filtering, slug for URLs
+        obj = cls(**data)
+        obj._state.adding = False
+        return obj
+
+    @classmethod
+    def _lookup(cls, slug):
+        if slug == cls.DEFAULT_SLUG:
+            obj, _ = cls.objects.get_or_create(slug=slug, defaults={"name": "Main event"})
+            return obj
+        return cls.objects.get(slug=slug)
+
+    @classmethod
+    def resolve(cls, slug):
+        """Event for a URL slug, via the shared cache. Raises Event.DoesNotExist."""
+        data = cache.get(cls.cache_key(slug))
+        if data is None:
+            obj = cls._lookup(slug)
+            data = {"id": obj.id, "slug": obj.slug, "name": obj.name}
+            cache.set(cls.cache_key(slug), data, timeout=300)
+        return cls._from_cache(data)
+
+    @classmethod
+    async def aresolve(cls, slug):
+        data = await cache.aget(cls.cache_key(slug))
+        if data is None:
+            if slug == cls.DEFAULT_SLUG:
+                obj, _ = await cls.objects.aget_or_create(slug=slug, defaults={"name": "Main event"})
+            else:
+                obj = await cls.objects.aget(slug=slug)
+            data = {"id": obj.id, "slug": obj.slug, "name": obj.name}
+            await cache.aset(cls.cache_key(slug), data, timeout=300)
+        return cls._from_cache(data)
+
+    @classmethod
+    def get_default(cls):
+        return cls.resolve(cls.DEFAULT_SLUG)
+
+
+class QuestionQuerySet(models.QuerySet):
+    """
+    Bulk writes that still reach screens and moderators: update() and delete()
+    bypass post_save/post_delete (or fire them per row), so they notify once
+    for the whole operation instead. See qa.realtime.broadcast_changes.
+    """
+
+    # fields screens or moderators display; updating anything else is silent
+    NOTIFY_FIELDS = {"status", "name", "question", "created_at", "event", "event_id"}
+
+    def _affected(self):
+        return list(self.order_by().values_list("pk", "event_id", "status"))
+
+    def update(self, **kwargs):
+        if not self.NOTIFY_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+
+        from .realtime import broadcast_changes, broadcast_transition
+
+        with transaction.atomic(using=self.db):
+            rows = self._affected()
+            count = super().update(**kwargs)
+            status = kwargs.get("status")
+            if status is None or isinstance(status, str):
+                # only the status decides who cares; other edits keep it as it was
+                by_status = {}
+                for row in rows:
+                    by_status.setdefault(status or row[2], []).append(row)
+                for new_status, batch in by_status.items():
+                    broadcast_changes(batch, new_status, reason="bulk_update")
+            else:
+                # an expression: read back what it set
+                now = dict(
+                    self.model.objects.using(self.db)
+                    .filter(pk__in=[row[0] for row in rows]).values_list("pk", "status")
+                )
+                batches = {}
+                for pk, event_id, old_status in rows:
+                    batches.setdefault((event_id, old_status, now.get(pk)), []).append(pk)
+                for (event_id, old_status, new_status), ids in batches.items():
+                    broadcast_transition(event_id, old_status, new_status, ids, reason="bulk_update")
+        return count
+
+    update.alters_data = True
+
+    def delete(self):
+        from .realtime import batched_notifications, broadcast_changes
+
+        with transaction.atomic(using=self.db), batched_notifications():
+            rows = self._affected()
+            result = super().delete()
+            broadcast_changes(rows, None, reason="bulk_delete")
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def listed(self, status):
+        """
+        Questions in `status` that are listed on their own: not folded into a
+        root (qa.dedup) that is in the same status.
+        """
+        return self.filter(status=status).exclude(duplicate_of__status=status)
+
+    def with_similar(self):
+        """Annotate `similar`: how many questions are folded into each one."""
+        folded = (
+            self.model.objects.filter(duplicate_of=models.OuterRef("pk"), status=models.OuterRef("status"))
+            .order_by().values("duplicate_of").annotate(n=models.Count("pk")).values("n")
+        )
+        return self.annotate(similar=Coalesce(models.Subquery(folded), 0))
+
+    def moderate(self, action, reason="bulk_moderation", chunk_size=None):
+        """approve / reject / delete every matching question in chunks; see qa.moderation."""
+        from .moderation import moderate_queryset
+        return moderate_queryset(self, action, reason=reason, chunk_size=chunk_size)
+
+    moderate.alters_data = True
+    moderate.queryset_only = True
+
+
 class Question(models.Model):
     STATUS_PENDING = "pending"
     STATUS_APPROVED = "approved"
@@ -16,21 +161,90 @@ class Question(models.Model):
         (STATUS_REJECTED, "Rejected"),
     ]
 
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="questions")
     name = models.CharField(max_length=120, blank=True, null=True)
     question = models.TextField()
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # Near-duplicate folding (qa.dedup): the cluster's root, always a root itself.
+    # A question is folded (not listed on its own) while its root has its status.
+    duplicate_of = models.ForeignKey(
+        "self", on_delete=models.SET_NULL, null=True, blank=True, related_name="duplicates",
+    )
+    # audience upvotes, added in batches from the vote buffer (qa.votes)
+    votes = models.PositiveIntegerField(default=0)
+
+    objects = QuestionQuerySet.as_manager()
 
     class Meta:
         indexes = [
-            models.Index(fields=["status", "-created_at"]),
+            # every feed is "one event, one status, newest first"
+            models.Index(fields=["event", "status", "-created_at"]),
+            # the screen's window: most voted first
+            models.Index(fields=["event", "status", "-votes", "-created_at"]),
         ]
 
+    # Status as last loaded from / written to the DB (None = not known, e.g. a new
+    # instance). Lets post_save see the transition without re-querying the row.
+    _loaded_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_status = self.status
+
     def __str__(self):
         return f"[{self.status}] {self.question[:60]}"
 
+class ArchivedQuestion(models.Model):
+    """
+    A question moved out of qa_question by `manage.py qa_retention archive`, as it
+    was then. On PostgreSQL the table is range-partitioned by month of created_at
+    (see 0007_archive), so old months are dropped whole instead of row by row.
+    """
+
+    id = models.BigIntegerField(primary_key=True)  # the question's id while it was live
+    event = models.ForeignKey(
+        Event, on_delete=models.CASCADE, related_name="archived_questions", db_index=False,
+    )
+    name = models.CharField(max_length=120, blank=True, null=True)
+    question = models.TextField()
+    status = models.CharField(max_length=16, choices=Question.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    votes = models.PositiveIntegerField(default=0)
+    duplicate_of_id = models.BigIntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "qa_question_archive"
+        indexes = [
+            models.Index(fields=["event", "created_at"], name="qa_archive_event_created_idx"),
+        ]
+
+    @classmethod
+    def from_question(cls, q):
+        return cls(
+            id=q.pk, event_id=q.event_id, name=q.name, question=q.question, status=q.status,
+            created_at=q.created_at, votes=q.votes, duplicate_of_id=q.duplicate_of_id,
+        )
+
+    def __str__(self):
+        return f"[archived {self.status}] {self.question[:60]}"
+
+
+def settings_version_key(event_id):
+    # Bumped (in the shared cache) whenever the event's AppSetting changes; see qa.signals
+    return f"qa:settings:version:{event_id}"
+
+
 class AppSetting(models.Model):
-    # Singleton (enforced by pk=1)
+    # One per event (created on first use by get_solo)
+    event = models.OneToOneField(Event, on_delete=models.CASCADE, related_name="settings")
     max_question_length = models.PositiveIntegerField(default=200, validators=[MinValueValidator(10)])
     submissions_enabled = models.BooleanField(default=True)
 
@@ -47,20 +261,63 @@ class AppSetting(models.Model):
     name_size = models.PositiveIntegerField(default=26, validators=[MinValueValidator(12)])      # px
     qr_size = models.PositiveIntegerField(default=180, validators=[MinValueValidator(100)])      # px
 
-    def save(self, *args, **kwargs):
-        self.pk = 1
-        super().save(*args, **kwargs)
+    # Process-local copies, per event: {event_id: (instance, settings version, last checked)}.
+    # Other workers' changes are picked up through settings_version_key(), which is
+    # re-read at most every QA_SETTINGS_LOCAL_TTL seconds.
+    _solo = {}
+
+    SOLO_DEFAULTS = {
+        "max_question_length": 200,
+        "submissions_enabled": True,
+    }
 
     @classmethod
-    def get_solo(cls):
-        obj, _ = cls.objects.get_or_create(
-            pk=1,
-            defaults={
-                "max_question_length": 200,
-                "submissions_enabled": True,
-            },
-        )
-        return obj
+    def _fresh_solo(cls, event_id, now, version=None):
+        """Cached instance if it is still good (within the TTL, or at `version`)."""
+        cached = cls._solo.get(event_id)
+        if cached is None:
+            return None
+        if version is None:
+            ttl = getattr(settings, "QA_SETTINGS_LOCAL_TTL", 1.0)
+            return cached[0] if now - cached[2] < ttl else None
+        if cached[1] == version:
+            cls._solo[event_id] = (cached[0], version, now)
+            return cached[0]
+        return None
+
+    @classmethod
+    def get_solo(cls, event=None):
+        event = event or Event.get_default()
+        now = time.monotonic()
+        obj = cls._fresh_solo(event.id, now)
+        if obj is None:
+            version = cache.get(settings_version_key(event.id), 0)
+            obj = cls._fresh_solo(event.id, now, version)
+        if obj is None:
+            # version read before the row: if it moves meanwhile we just reload next time
+            obj, _ = cls.objects.get_or_create(event_id=event.id, defaults=cls.SOLO_DEFAULTS)
+            cls._solo[event.id] = (obj, version, now)
+        return copy.copy(obj)
+
+    @classmethod
+    async def aget_solo(cls, event=None):
+        event = event or await Event.aresolve(Event.DEFAULT_SLUG)
+        now = time.monotonic()
+        obj = cls._fresh_solo(event.id, now)
+        if obj is None:
+            version = await cache.aget(settings_version_key(event.id), 0)
+            obj = cls._fresh_solo(event.id, now, version)
+        if obj is None:
+            obj, _ = await cls.objects.aget_or_create(event_id=event.id, defaults=cls.SOLO_DEFAULTS)
+            cls._solo[event.id] = (obj, version, now)
+        return copy.copy(obj)
+
+    @classmethod
+    def clear_solo_cache(cls, event_id=None):
+        if event_id is None:
+            cls._solo.clear()
+        else:
+            cls._solo.pop(event_id, None)
 
     def __str__(self):
-        return "App Settings (Singleton)"
+        return f"App Settings ({self.event})"
@@ -0,0 +1,232 @@
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_time
+
+from .coalescer import get_coalescer
+from .models import Question
+from .realtime import MODERATORS, broadcast_transition, broadcast_unlinked, group_name
+
+# action -> status the rows end up in (None = deleted)
+ACTIONS = {
+    "approve": Question.STATUS_APPROVED,
+    "reject": Question.STATUS_REJECTED,
+    "delete": None,
+}
+
+STATUSES = [value for value, _ in Question.STATUS_CHOICES]
+
+# What a chunk hands back to the broadcast: enough for a screen delta row
+RETURNING_FIELDS = ("id", "event_id", "name", "question", "status", "created_at", "votes", "duplicate_of_id")
+
+
+def _parse_when(value):
+    """ISO datetime, or a bare "HH:MM" meaning today (local time)."""
+    when = parse_datetime(value)
+    if when is None:
+        t = parse_time(value)
+        if t is None:
+            raise ValueError(f"Invalid time: {value}")
+        when = datetime.combine(timezone.localdate(), t)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+def parse_filters(data, required=True):
+    """
+    Filter kwargs for Question from POST/GET data; ValueError on bad input.
+
+      ids            comma-separated question IDs
+      status         pending | approved | rejected
+      created_after  ISO datetime or HH:MM (today)
+      created_before ISO datetime or HH:MM (today)
+      name           exact name, case-insensitive
+      text           substring of the question, case-insensitive
+    """
+    filters = {}
+    ids_raw = (data.get("ids") or "").strip()
+    if ids_raw:
+        try:
+            filters["id__in"] = [int(x) for x in ids_raw.split(",") if x.strip()]
+        except ValueError:
+            raise ValueError("Invalid ids")
+
+    status = (data.get("status") or "").strip()
+    if status:
+        if status not in STATUSES:
+            raise ValueError("Invalid status")
+        filters["status"] = status
+
+    for param, lookup in (("created_after", "created_at__gte"), ("created_before", "created_at__lt")):
+        value = (data.get(param) or "").strip()
+        if value:
+            filters[lookup] = _parse_when(value)
+
+    name = (data.get("name") or "").strip()
+    if name:
+        filters["name__iexact"] = name
+    text = (data.get("text") or "").strip()
+    if text:
+        filters["question__icontains"] = text
+
+    if required and not filters:
+        # never "everything in the event" by accident
+        raise ValueError("No filter given")
+    return filters
+
+
+def _supports_update_returning(connection):
+    # SQLite has RETURNING from 3.35 on, the same versions Django inserts with it;
+    # MariaDB returns from INSERT but not from UPDATE, hence the vendor check
+    return connection.vendor in ("postgresql", "sqlite") and connection.features.can_return_columns_from_insert
+
+
+def change_chunk(qs, target, size):
+    """
+    Change (or delete) up to `size` rows of qs in one statement and return them as
+    Question instances, as they are after the change. The statement is
+
+      UPDATE qa_question SET status = %s
+       WHERE id IN (SELECT id ... WHERE <filters> ORDER BY id LIMIT size)
+      RETURNING ...
+    """
+    connection = connections[qs.db]
+    qn = connection.ops.quote_name
+    meta = Question._meta
+    table = qn(meta.db_table)
+    pk = qn(meta.pk.column)
+
+    sub = qs.order_by("pk").values("pk")[:size]
+    if target is None:
+        # The raw DELETE skips Django's collector, so do its SET_NULL on
+        # duplicate_of here: duplicates left behind become roots of their own,
+        # which screens/moderators have to hear about.
+        ids = list(sub.values_list("pk", flat=True))
+        if not ids:
+            return []
+        unlinked = list(
+            Question.objects.using(qs.db).filter(duplicate_of__in=ids).exclude(pk__in=ids)
+            .values_list("pk", "event_id", "status", "duplicate_of__status")
+        )
+        if unlinked:
+            Question.objects.using(qs.db).filter(pk__in=[row[0] for row in unlinked]).update(duplicate_of=None)
+            broadcast_unlinked(unlinked)
+        sub = Question.objects.using(qs.db).filter(pk__in=ids).values("pk")
+
+    if not _supports_update_returning(connection):
+        # e.g. MySQL or an old SQLite: same chunking, but re-read the rows before changing them
+        ids = list(sub.values_list("pk", flat=True))
+        rows = list(Question.objects.using(qs.db).filter(pk__in=ids).only(*RETURNING_FIELDS))
+        changed = Question.objects.using(qs.db).filter(pk__in=ids)
+        if target is None:
+            changed._raw_delete(qs.db)
+        else:
+            # plain QuerySet.update: the caller broadcasts for this chunk
+            models.QuerySet.update(changed, status=target)
+            for row in rows:
+                row.status = target
+        return rows
+
+    sub_sql, sub_params = sub.query.get_compiler(qs.db).as_sql()
+    returning = ", ".join(qn(meta.get_field(f).column) for f in RETURNING_FIELDS)
+    if target is None:
+        sql = f"DELETE FROM {table} WHERE {pk} IN ({sub_sql}) RETURNING {returning}"
+        params = sub_params
+    else:
+        status = qn(meta.get_field("status").column)
+        sql = f"UPDATE {table} SET {status} = %s WHERE {pk} IN ({sub_sql}) RETURNING {returning}"
+        params = (target, *sub_params)
+    return list(Question.objects.using(qs.db).raw(sql, params))
+
+
+def _progress(event_id, operation, action, done, total, finished=False):
+    message = {
+        "type": "broadcast.progress",
+        "operation": operation,
+        "action": action,
+        "done": done,
+        "total": total,
+        "finished": finished,
+    }
+    transaction.on_commit(lambda: get_coalescer().submit(group_name(MODERATORS, event_id), message))
+
+
+def moderate_queryset(qs, action, reason="bulk_moderation", chunk_size=None):
+    """
+    Apply approve/reject/delete to every question in qs, in chunks of at most
+    `chunk_size` rows (QA_BULK_CHUNK_SIZE). Usually reached as qs.moderate(action).
+
+    Each chunk is its own short transaction, so locks are held briefly and screens
+    and moderators see the change progressively. The rows returned by each chunk
+    feed its broadcast directly; nothing is re-queried. Rows already in the target
+    status are skipped. Returns the number of rows changed.
+    """
+    target = ACTIONS[action]
+    size = chunk_size or getattr(settings, "QA_BULK_CHUNK_SIZE", 500)
+    # the filter is kept as is; only ordering/slicing is ours
+    qs = qs.order_by()
+
+    done = 0
+    event_ids = list(qs.values_list("event_id", flat=True).distinct())
+    for event_id in event_ids:
+        done += _moderate_event(qs.filter(event_id=event_id), event_id, target, action, size, reason)
+    return done
+
+
+def _moderate_event(qs, event_id, target, action, size, reason):
+    # One pass per source status, so every chunk knows which groups it concerns
+    # (the old status isn't available from RETURNING).
+    sources = [s for s in STATUSES if s != target]
+    counts = dict(
+        qs.filter(status__in=sources).values_list("status").annotate(n=models.Count("pk"))
+    )
+    total = sum(counts.values())
+    operation = uuid.uuid4().hex
+    chunked = total > size
+    done = 0
+    for source in sources:
+        if not counts.get(source):
+            continue
+        source_qs = qs.filter(status=source)
+        while True:
+            with transaction.atomic(using=qs.db):
+                rows = change_chunk(source_qs, target, size)
+                if rows:
+                    broadcast_transition(
+                        event_id, source, target, [q.pk for q in rows], questions=rows, reason=reason,
+                    )
+                    done += len(rows)
+                    if chunked:
+                        _progress(event_id, operation, action, done, total)
+            if len(rows) < size:
+                break
+
+    if chunked:
+        _progress(event_id, operation, action, done, total, finished=True)
+    return done
+
+
+def with_duplicates(qs):
+    """
+    qs widened to whole clusters: the questions folded into any of its questions
+    (qa.dedup) come along. Ids are read up front, so the selection doesn't shift
+    while chunks change statuses or unlink deleted roots.
+    """
+    ids = list(qs.values_list("pk", flat=True))
+    folded = Question.objects.using(qs.db).filter(duplicate_of__in=ids).exclude(pk__in=ids)
+    return Question.objects.using(qs.db).filter(pk__in=ids + list(folded.values_list("pk", flat=True)))
+
+
+def bulk_moderate(event, action, filters, chunk_size=None, reason="bulk_moderation", clusters=False):
+    """
+    moderate_queryset() for the questions of `event` matching parse_filters() output;
+    with clusters=True their near-duplicates too.
+    """
+    qs = Question.objects.filter(event=event, **filters)
+    if clusters:
+        qs = with_duplicates(qs)
+    return qs.moderate(action, reason=reason, chunk_size=chunk_size)
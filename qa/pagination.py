@@ -0,0 +1,75 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+# Keyset pagination over (-created_at, -id), which the (event, status, -created_at)
+# index serves directly: each page is one index range scan, however deep it is.
+
+MAX_LIMIT = 200
+
+
+def encode_cursor(row) -> str:
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """(created_at, id) from a cursor; ValueError if it isn't one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        ts, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def page_params(request, default_limit):
+    """(limit, before, after) from the query string; ValueError on bad input."""
+    limit = int(request.GET.get("limit") or default_limit)
+    if limit < 1:
+        raise ValueError("Invalid limit")
+    before = request.GET.get("before")
+    after = request.GET.get("after")
+    if before and after:
+        raise ValueError("Use either before or after")
+    return (
+        min(limit, MAX_LIMIT),
+        decode_cursor(before) if before else None,
+        decode_cursor(after) if after else None,
+    )
+
+
+def _page_query(qs, limit, before, after):
+    if after is not None:
+        ts, pk = after
+        qs = qs.filter(Q(created_at__gt=ts) | Q(created_at=ts, id__gt=pk)).order_by("created_at", "id")
+    else:
+        if before is not None:
+            ts, pk = before
+            qs = qs.filter(Q(created_at__lt=ts) | Q(created_at=ts, id__lt=pk))
+        qs = qs.order_by("-created_at", "-id")
+    # one extra row tells us whether there is another page
+    return qs[:limit + 1]
+
+
+def _page(rows, limit, before, after):
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()  # always newest first in the response
+    return {
+        "rows": rows,
+        # older rows: ?before=next ; newer rows: ?after=prev
+        "next": encode_cursor(rows[-1]) if rows and (more or after is not None) else None,
+        "prev": encode_cursor(rows[0]) if rows else None,
+    }
+
+
+def fetch_page(qs, limit, before=None, after=None):
+    return _page(list(_page_query(qs, limit, before, after)), limit, before, after)
+
+
+async def afetch_page(qs, limit, before=None, after=None):
+    rows = [row async for row in _page_query(qs, limit, before, after)]
+    return _page(rows, limit, before, after)
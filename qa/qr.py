@@ -0,0 +1,56 @@
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.core.cache import cache
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+
+
+def _render(data: str, fmt: str, box_size: int, fill: str, back: str) -> bytes:
+    qr = qrcode.QRCode(
+        version=3,
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=box_size,
+        border=2,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    if fmt == "svg":
+        factory = type("SvgQR", (qrcode.image.svg.SvgPathFillImage,), {
+            "background": back,
+            "QR_PATH_STYLE": {**qrcode.image.svg.SvgPathImage.QR_PATH_STYLE, "fill": fill},
+        })
+        return qr.make_image(image_factory=factory).to_string()
+
+    img = qr.make_image(fill_color=fill, back_color=back)
+    buff = BytesIO()
+    img.save(buff, format="PNG")
+    return buff.getvalue()
+
+
+@lru_cache(maxsize=32)
+def qr_image(data: str, fmt: str = "png", box_size: int = 8,
+             fill: str = "black", back: str = "white") -> bytes:
+    """
+    Encoded QR image for `data`. Memoized in-process, and in the shared cache so a
+    fresh worker doesn't have to render it again either. `data` holds the request's
+    host, so the shared entries expire (QA_QR_CACHE_TIMEOUT) rather than pile up
+    one per host name the site was reached by.
+    """
+    key = "qa:qr:" + hashlib.sha1(
+        "|".join([data, fmt, str(box_size), fill, back]).encode("utf-8")
+    ).hexdigest()
+    timeout = getattr(settings, "QA_QR_CACHE_TIMEOUT", 86400)
+    return cache.get_or_set(key, lambda: _render(data, fmt, box_size, fill, back), timeout=timeout)
+
+
+def qr_etag(image: bytes) -> str:
+    return '"%s"' % hashlib.sha1(image).hexdigest()
@@ -0,0 +1,142 @@
+import secrets
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.signing import BadSignature
+
+DEVICE_COOKIE = "qa_device"
+DEVICE_COOKIE_SALT = "qa.device"
+DEVICE_COOKIE_MAX_AGE = 60 * 60 * 24 * 365
+
+_PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate: str):
+    """"5/m" -> (5, 60.0) — hits allowed per window seconds."""
+    count, period = rate.split("/")
+    return int(count), float(_PERIODS[period[-1]] * int(period[:-1] or 1))
+
+
+# Sliding-window log per key (a sorted set of hit timestamps). All keys are checked
+# first and the hit is only recorded if every one of them is under its limit, so
+# a request costs a single round trip however many keys it is limited on.
+_SLIDING_WINDOW = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[1 + i * 2])
+    local window = tonumber(ARGV[2 + i * 2])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        return 0
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, member)
+    redis.call('PEXPIRE', key, math.ceil(tonumber(ARGV[2 + i * 2])))
+end
+return 1
+"""
+
+
+class RedisRateLimiter:
+    """Shared across workers; one EVALSHA per check."""
+
+    def __init__(self, client, prefix="qa:rl:"):
+        self.prefix = prefix
+        self._script = client.register_script(_SLIDING_WINDOW)
+
+    def hit(self, limits) -> bool:
+        """limits: [(key, "5/m"), ...]. True if allowed (and counted)."""
+        keys, args = [], [int(time.time() * 1000), uuid.uuid4().hex]
+        for key, rate in limits:
+            count, window = parse_rate(rate)
+            keys.append(self.prefix + key)
+            args += [count, int(window * 1000)]
+        return bool(self._script(keys=keys, args=args))
+
+
+class LocalRateLimiter:
+    """Same semantics in process memory — for tests and single-worker dev."""
+
+    def __init__(self):
+        self._hits = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def hit(self, limits) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            windows = []
+            for key, rate in limits:
+                count, window = parse_rate(rate)
+                hits = self._hits[key]
+                while hits and hits[0] <= now - window:
+                    hits.popleft()
+                if len(hits) >= count:
+                    return False
+                windows.append(hits)
+            for hits in windows:
+                hits.append(now)
+            return True
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                if getattr(settings, "QA_RATELIMIT_BACKEND", "redis") == "local":
+                    _limiter = LocalRateLimiter()
+                else:
+                    from .redis_client import get_redis
+                    _limiter = RedisRateLimiter(get_redis())
+    return _limiter
+
+
+def get_device_id(request):
+    try:
+        return request.get_signed_cookie(DEVICE_COOKIE, salt=DEVICE_COOKIE_SALT)
+    except (KeyError, BadSignature):
+        return None
+
+
+def set_device_cookie(request, response):
+    """Hand out a device id on /ask/ so phones behind one venue NAT are told apart."""
+    if get_device_id(request) is None:
+        response.set_signed_cookie(
+            DEVICE_COOKIE, secrets.token_urlsafe(16), salt=DEVICE_COOKIE_SALT,
+            max_age=DEVICE_COOKIE_MAX_AGE, httponly=True, samesite="Lax",
+            secure=not settings.DEBUG,
+        )
+    return response
+
+
+def ask_allowed(request) -> bool:
+    """
+    Count one /ask/ submission. A device with our cookie gets QA_ASK_RATE and shares
+    the looser QA_ASK_IP_RATE with everyone on its IP; without the cookie the IP
+    itself is held to QA_ASK_RATE, as before.
+    """
+    ip = request.META.get("REMOTE_ADDR", "")
+    device = get_device_id(request)
+    device_rate = getattr(settings, "QA_ASK_RATE", "5/m")
+    if device is None:
+        limits = [(f"ask:ip:{ip}", device_rate)]
+    else:
+        limits = [
+            (f"ask:dev:{device}", device_rate),
+            (f"ask:ipall:{ip}", getattr(settings, "QA_ASK_IP_RATE", "120/m")),
+        ]
+    return get_limiter().hit(limits)
+
+
+def vote_allowed(device) -> bool:
+    """Count one upvote tap from a device against QA_VOTE_RATE."""
+    return get_limiter().hit([(f"vote:dev:{device}", getattr(settings, "QA_VOTE_RATE", "60/m"))])
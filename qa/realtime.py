@@ -0,0 +1,274 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from . import dedup, metrics, replay
+from .coalescer import get_coalescer
+from .models import Question, settings_version_key
+
+# Group kinds; the channel-layer group is per event, see group_name()
+SCREENS = "screens"
+MODERATORS = "moderators"
+
+# Question statuses each group actually displays. A status change only concerns
+# a group when the old or the new status is one it shows.
+GROUP_STATUSES = {
+    SCREENS: {Question.STATUS_APPROVED},
+    MODERATORS: {Question.STATUS_PENDING},
+}
+
+QUESTION_FIELDS = ("id", "name", "question", "created_at", "votes")
+
+_encoder = DjangoJSONEncoder()
+
+
+def group_name(kind: str, event_id) -> str:
+    # a broadcast in one event never reaches sockets of another
+    return f"{kind}.{event_id}"
+
+
+def groups_for_transition(old_status, new_status):
+    """
+    Groups that must hear about a question going from old_status to new_status.
+    None means "not known" (old) or "gone" (new, i.e. deleted). If neither side
+    is known we can't rule anything out and notify everyone.
+    """
+    if old_status is None and new_status is None:
+        return set(GROUP_STATUSES)
+    return {
+        group for group, statuses in GROUP_STATUSES.items()
+        if old_status in statuses or new_status in statuses
+    }
+
+
+# Shared (cross-worker) counters per event; every change to the approved list /
+# settings gets the next number.
+
+def screen_version_key(event_id):
+    return f"qa:screen:version:{event_id}"
+
+
+def _bump(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # first change since the cache was flushed
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+
+def current_version(event_id):
+    return cache.get(screen_version_key(event_id), 0)
+
+
+async def acurrent_version(event_id):
+    return await cache.aget(screen_version_key(event_id), 0)
+
+
+def next_version(event_id):
+    return _bump(screen_version_key(event_id))
+
+
+def settings_version(event_id):
+    return cache.get(settings_version_key(event_id), 0)
+
+
+async def asettings_version(event_id):
+    return await cache.aget(settings_version_key(event_id), 0)
+
+
+def bump_settings_version(event_id):
+    return _bump(settings_version_key(event_id))
+
+
+def question_row(q):
+    """
+    JSON/msgpack-safe dict for a Question instance or a .values(*QUESTION_FIELDS) dict.
+    Dates are encoded exactly like JsonResponse does, so deltas match approved.json.
+    """
+    if not isinstance(q, dict):
+        q = {f: getattr(q, f) for f in QUESTION_FIELDS}
+    row = dict(q)
+    row["created_at"] = _encoder.default(row["created_at"])
+    return row
+
+
+def _group_send(group: str, message: dict):
+    # queued and merged off the request thread; see qa.coalescer
+    if metrics.enabled():
+        metrics.broadcasts.inc(kind=metrics.group_kind(group), type=message["type"])
+    get_coalescer().submit(group, message)
+
+
+def _stamp(change):
+    # lets screens measure approval -> delivery (qa_approval_delivery_seconds)
+    if metrics.enabled():
+        change["committed_at"] = time.time()
+
+
+def _refresh_message(reason, ids):
+    return {
+        "type": "broadcast.refresh",
+        "reason": reason,
+        "ids": [int(i) for i in ids],
+    }
+
+
+def _change(action, questions, ids):
+    change = {"action": action}
+    if action == "approve":
+        change["questions"] = [question_row(q) for q in questions]
+    else:
+        change["ids"] = [int(i) for i in ids]
+    return change
+
+
+def broadcast_refresh(event_id, kind: str, reason: str, ids=()):
+    message = _refresh_message(reason, ids)
+    # clients refetch on receipt, so don't tell them before the change is visible
+    transaction.on_commit(lambda: _group_send(group_name(kind, event_id), message))
+
+
+def broadcast_delta(event_id, action: str, questions=(), ids=()):
+    """
+    Push one versioned change to the event's screens.
+
+    action "approve" carries the full question rows (upsert on the client);
+    any other action ("reject", "delete", "pending") carries ids to remove.
+
+    The version is only taken once the surrounding transaction commits, so a
+    reader that sees version N also sees the rows that produced it.
+    """
+    _send_change(event_id, _change(action, questions, ids))
+
+
+def broadcast_votes(event_id, counts):
+    """
+    Versioned ranking change for screens: {question id: vote total} for the
+    approved questions whose votes moved. Sent once per vote flush (qa.votes),
+    however many votes the flush carried.
+    """
+    _send_change(event_id, {"action": "votes", "votes": {str(pk): n for pk, n in counts.items()}})
+
+
+def _send_change(event_id, change):
+    def send():
+        change["version"] = next_version(event_id)
+        _stamp(change)
+        _group_send(group_name(SCREENS, event_id), {"type": "broadcast.delta", "changes": [change]})
+        replay.record(event_id, change)
+
+    transaction.on_commit(send)
+
+
+# --------------------------------------------------
+# Change notification: every write path (post_save/post_delete for single rows,
+# QuestionQuerySet.update()/delete()/moderate() for bulk ones) ends up here, so a
+# bulk operation sends one batched message per event and group, not one per row.
+# --------------------------------------------------
+
+# screen delta action for questions leaving the approved list, by new status
+_LEAVE_ACTIONS = {
+    Question.STATUS_REJECTED: "reject",
+    Question.STATUS_PENDING: "pending",
+    None: "delete",
+}
+
+_row_signals_suppressed = ContextVar("qa_row_signals_suppressed", default=False)
+
+
+@contextmanager
+def batched_notifications():
+    """Silence the per-row signal handlers; the caller notifies for the whole batch."""
+    token = _row_signals_suppressed.set(True)
+    try:
+        yield
+    finally:
+        _row_signals_suppressed.reset(token)
+
+
+def row_signals_suppressed() -> bool:
+    return _row_signals_suppressed.get()
+
+
+def _root_id(q):
+    return q.get("duplicate_of_id") if isinstance(q, dict) else getattr(q, "duplicate_of_id", None)
+
+
+def _unfolded(ids, questions):
+    """
+    Rows for a screen upsert, without the near-duplicates of an approved root:
+    screens show the root only (see approved.json).
+    """
+    approved = Question.STATUS_APPROVED
+    if questions is None:
+        return list(
+            Question.objects.filter(pk__in=ids).exclude(duplicate_of__status=approved).values(*QUESTION_FIELDS)
+        )
+    roots = {_root_id(q) for q in questions} - {None}
+    if roots:
+        roots = set(Question.objects.filter(pk__in=roots, status=approved).values_list("pk", flat=True))
+    return [q for q in questions if _root_id(q) not in roots]
+
+
+def broadcast_transition(event_id, old_status, new_status, ids, questions=None,
+                         reason="update", groups=None):
+    """
+    Tell the event's screens/moderators that `ids` went from old_status to
+    new_status (None = deleted), in one message per group.
+
+    `questions` are the rows for a screen upsert (new_status approved); they are
+    read by id if not given. `groups` overrides groups_for_transition().
+    """
+    ids = [int(i) for i in ids]
+    if not ids:
+        return
+    if groups is None:
+        groups = groups_for_transition(old_status, new_status)
+
+    if MODERATORS in groups:
+        broadcast_refresh(event_id, MODERATORS, reason, ids=ids)
+    if SCREENS in groups:
+        if new_status == Question.STATUS_APPROVED:
+            questions = _unfolded(ids, questions)
+            if questions:
+                broadcast_delta(event_id, "approve", questions=questions)
+        else:
+            broadcast_delta(event_id, _LEAVE_ACTIONS[new_status], ids=ids)
+    if new_status in (Question.STATUS_REJECTED, None):
+        # nothing new should be folded into these any more
+        transaction.on_commit(lambda: dedup.forget(event_id, ids))
+
+
+def broadcast_unlinked(rows, reason="duplicates_unlinked"):
+    """
+    Near-duplicates whose root is being deleted, as rows of (id, event_id,
+    status, root status) read before unlinking them: each is now listed on its
+    own. Screens get the approved ones that were folded into an approved root;
+    moderators a refresh, as their clusters changed.
+    """
+    by_event = {}
+    for pk, event_id, status, root_status in rows:
+        by_event.setdefault(event_id, []).append((pk, status == root_status == Question.STATUS_APPROVED))
+    for event_id, batch in by_event.items():
+        broadcast_refresh(event_id, MODERATORS, reason, ids=[pk for pk, _ in batch])
+        surfaced = [pk for pk, folded in batch if folded]
+        if surfaced:
+            approved = Question.STATUS_APPROVED
+            broadcast_transition(event_id, approved, approved, surfaced, reason=reason, groups={SCREENS})
+
+
+def broadcast_changes(rows, new_status, reason="update"):
+    """
+    Batched broadcast_transition() for rows of (id, event_id, old_status), e.g. as
+    read just before a bulk update/delete. new_status None = deleted.
+    """
+    batches = {}
+    for pk, event_id, old_status in rows:
+        batches.setdefault((event_id, old_status), []).append(pk)
+    for (event_id, old_status), ids in batches.items():
+        broadcast_transition(event_id, old_status, new_status, ids, reason=reason)
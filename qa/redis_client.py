@@ -0,0 +1,22 @@
+import threading
+
+from django.conf import settings
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    """Process-wide redis-py client on a bounded, blocking connection pool."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                import redis
+                pool = redis.BlockingConnectionPool.from_url(
+                    settings.REDIS_URL,
+                    max_connections=getattr(settings, "REDIS_MAX_CONNECTIONS", 50),
+                    timeout=getattr(settings, "REDIS_POOL_TIMEOUT", 5),
+                )
+                _client = redis.Redis(connection_pool=pool)
+    return _client
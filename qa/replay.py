@@ -0,0 +1,104 @@
+import json
+import logging
+import threading
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# The last QA_REPLAY_SIZE versioned screen changes of each event (the deltas of
+# qa.realtime), so a screen that reconnects with ?since=<its version> gets only
+# what it missed instead of a full snapshot. Everyone reconnecting at once after
+# a deploy or a Wi-Fi blip then costs one read of this log each, not a query.
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+class RedisReplayLog:
+    """A sorted set per event, scored by version. Shared across workers."""
+
+    def __init__(self, client, prefix="qa:replay:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, event_id):
+        return f"{self.prefix}{event_id}"
+
+    def append(self, event_id, change):
+        key = self._key(event_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(key, {json.dumps(change): change["version"]})
+        pipe.zremrangebyrank(key, 0, -_conf("QA_REPLAY_SIZE", 200) - 1)
+        pipe.expire(key, _conf("QA_REPLAY_TTL", 2 * 86400))
+        pipe.execute()
+
+    def since(self, event_id, version):
+        return [json.loads(raw) for raw in self.client.zrangebyscore(self._key(event_id), f"({version}", "+inf")]
+
+
+class LocalReplayLog:
+    """Same in process memory — for tests and single-worker dev."""
+
+    def __init__(self):
+        self._changes = defaultdict(lambda: deque(maxlen=_conf("QA_REPLAY_SIZE", 200)))
+        self._lock = threading.Lock()
+
+    def append(self, event_id, change):
+        with self._lock:
+            self._changes[event_id].append(change)
+
+    def since(self, event_id, version):
+        with self._lock:
+            return [c for c in self._changes.get(event_id, ()) if c["version"] > version]
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                if _conf("QA_REPLAY_BACKEND", "redis") == "local":
+                    _log = LocalReplayLog()
+                else:
+                    from .redis_client import get_redis
+                    _log = RedisReplayLog(get_redis())
+    return _log
+
+
+# Like the dedup index, the log is an optimization: if it can't be reached,
+# a reconnecting screen just gets a full snapshot.
+
+def record(event_id, change):
+    """Keep a change that was just broadcast (it has its version)."""
+    try:
+        get_log().append(event_id, change)
+    except Exception:
+        logger.exception("replay log update failed")
+
+
+def missed(event_id, since, version):
+    """
+    The changes after `since`, oldest first — or None unless the log has every
+    one of them up to `version` (too old, or one still on its way to the log).
+    """
+    try:
+        changes = get_log().since(event_id, since)
+    except Exception:
+        logger.exception("replay log read failed")
+        return None
+    changes.sort(key=lambda c: c["version"])
+    expected = since + 1
+    for change in changes:
+        if change["version"] != expected:
+            return None
+        expected += 1
+    if expected <= version:
+        return None
+    return changes
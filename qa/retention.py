@@ -0,0 +1,150 @@
+import re
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Max, Min
+
+from .models import ArchivedQuestion, Question
+from .moderation import change_chunk
+from .realtime import broadcast_changes
+
+# Retention for qa_question, which otherwise only grows.
+#
+#   archive  move old questions to qa_question_archive
+#   purge    delete old questions outright (e.g. rejected ones)
+#   drop     delete archived questions; on PostgreSQL whole monthly partitions
+#
+# Live rows go in batches of QA_RETENTION_BATCH_SIZE, each a short transaction of
+# its own (the DELETE ... RETURNING used by bulk moderation), so locks stay short
+# and there is one notification per batch instead of a post_delete per row.
+
+ARCHIVE_TABLE = ArchivedQuestion._meta.db_table
+_partition_re = re.compile(rf"^{ARCHIVE_TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def partitioned(using="default") -> bool:
+    """True if the archive is a partitioned table (see migration 0007_archive)."""
+    return connections[using].vendor == "postgresql"
+
+
+def _month(dt):
+    dt = dt.astimezone(dt_timezone.utc)
+    return datetime(dt.year, dt.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _next_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def partition_name(month) -> str:
+    return f"{ARCHIVE_TABLE}_p{month:%Y%m}"
+
+
+def ensure_partitions(start, end, using="default"):
+    """Create the monthly archive partitions covering start..end (PostgreSQL)."""
+    if not partitioned(using):
+        return
+    qn = connections[using].ops.quote_name
+    month = _month(start)
+    with connections[using].cursor() as cursor:
+        while month <= end:
+            upper = _next_month(month)
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {qn(partition_name(month))} PARTITION OF {qn(ARCHIVE_TABLE)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [month, upper],
+            )
+            month = upper
+
+
+def old_questions(before, statuses=None, event_id=None):
+    """Live questions created before `before`, optionally of some statuses / one event."""
+    qs = Question.objects.filter(created_at__lt=before)
+    if statuses:
+        qs = qs.filter(status__in=statuses)
+    if event_id is not None:
+        qs = qs.filter(event_id=event_id)
+    return qs
+
+
+def move_batches(qs, archive=True, batch_size=None, pause=0.0):
+    """
+    Delete the questions in qs in batches, copying each batch into the archive
+    first if `archive`. Yields the size of every batch.
+    """
+    size = batch_size or _conf("QA_RETENTION_BATCH_SIZE", 1000)
+    qs = qs.order_by()
+    if archive:
+        span = qs.aggregate(start=Min("created_at"), end=Max("created_at"))
+        if span["start"] is not None:
+            ensure_partitions(span["start"], span["end"], using=qs.db)
+
+    while True:
+        with transaction.atomic(using=qs.db):
+            rows = change_chunk(qs, None, size)
+            if archive and rows:
+                ArchivedQuestion.objects.using(qs.db).bulk_create(
+                    [ArchivedQuestion.from_question(q) for q in rows]
+                )
+            # gone from screens/moderation lists: one message per event and group
+            broadcast_changes([(q.pk, q.event_id, q.status) for q in rows], None, reason="retention")
+        yield len(rows)
+        if len(rows) < size:
+            return
+        if pause:
+            time.sleep(pause)
+
+
+def archive_partitions(before, using="default"):
+    """Names of the archive partitions holding only rows created before `before`."""
+    if not partitioned(using):
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s ORDER BY c.relname",
+            [ARCHIVE_TABLE],
+        )
+        names = [name for name, in cursor.fetchall()]
+    old = []
+    for name in names:
+        m = _partition_re.match(name)
+        if m and _next_month(datetime(int(m[1]), int(m[2]), 1, tzinfo=dt_timezone.utc)) <= before:
+            old.append(name)
+    return old
+
+
+def drop_archived(before, batch_size=None, pause=0.0, using="default"):
+    """
+    Remove archived questions created before `before`. Yields (what, count):
+    a dropped partition per whole month on PostgreSQL, then batches for the rest.
+    """
+    qn = connections[using].ops.quote_name
+    for name in archive_partitions(before, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {qn(name)}")
+            count = cursor.fetchone()[0]
+            # a catalog change, not a scan: no dead tuples left for vacuum
+            cursor.execute(f"DROP TABLE {qn(name)}")
+        yield name, count
+
+    # the month `before` falls in (or the whole table without partitions)
+    size = batch_size or _conf("QA_RETENTION_BATCH_SIZE", 1000)
+    qs = ArchivedQuestion.objects.using(using).filter(created_at__lt=before)
+    while True:
+        with transaction.atomic(using=using):
+            ids = list(qs.order_by("created_at", "pk").values_list("pk", flat=True)[:size])
+            if ids:
+                ArchivedQuestion.objects.using(using).filter(pk__in=ids, created_at__lt=before)._raw_delete(using)
+        yield "batch", len(ids)
+        if len(ids) < size:
+            return
+        if pause:
+            time.sleep(pause)
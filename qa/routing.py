@@ -4,4 +4,6 @@ from .consumers import ScreenConsumer, ModerationConsumer
 websocket_urlpatterns = [
     re_path(r"ws/screen/$", ScreenConsumer.as_asgi()),
     re_path(r"ws/moderation/$", ModerationConsumer.as_asgi()),
+    re_path(r"ws/e/(?P<event_slug>[-\w]+)/screen/$", ScreenConsumer.as_asgi()),
+    re_path(r"ws/e/(?P<event_slug>[-\w]+)/moderation/$", ModerationConsumer.as_asgi()),
 ]
@@ -0,0 +1,62 @@
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVectorField, TrigramSimilarity, TrigramWordSimilarity,
+)
+from django.db import connections
+from django.db.models import F, FloatField, Func, Q, Value
+
+# Full-text config for the search document. "simple" (no stemming, no stop words)
+# because audiences ask in more than one language. Must match migration 0004.
+SEARCH_CONFIG = "simple"
+
+
+class SearchDocument(Func):
+    """
+    to_tsvector('simple', COALESCE(name, '') || ' ' || question) — written out by
+    hand so it is the very expression the GIN index in 0004_search is built on;
+    SearchVector() would render differently and miss the index.
+    """
+
+    template = f"to_tsvector('{SEARCH_CONFIG}'::regconfig, COALESCE(%(expressions)s)"
+    arg_joiner = ", '') || ' ' || "
+    output_field = SearchVectorField()
+
+    def __init__(self):
+        super().__init__(F("name"), F("question"))
+
+
+def postgres_search(using) -> bool:
+    return connections[using].vendor == "postgresql"
+
+
+def search_questions(qs, term):
+    """
+    Questions in qs matching `term`, best first, annotated with `search_rank`.
+
+    On PostgreSQL: full-text (websearch syntax: "quoted phrases", -exclusions, or)
+    plus trigram word similarity for typos and partial words, all served by the
+    0004_search indexes. Elsewhere: case-insensitive substring match, newest first.
+    """
+    term = term.strip()
+    if not postgres_search(qs.db):
+        return (
+            qs.filter(Q(question__icontains=term) | Q(name__icontains=term))
+            .annotate(search_rank=Value(None, output_field=FloatField()))
+            .order_by("-created_at", "-id")
+        )
+
+    query = SearchQuery(term, config=SEARCH_CONFIG, search_type="websearch")
+    document = SearchDocument()
+    return (
+        qs.annotate(search_document=document)
+        .filter(
+            Q(search_document=query)
+            | Q(question__trigram_word_similar=term)
+            | Q(name__trigram_similar=term)
+        )
+        .annotate(
+            search_rank=SearchRank(document, query)
+            + TrigramWordSimilarity(term, "question")
+            + TrigramSimilarity("name", term) / 2,
+        )
+        .order_by("-search_rank", "-created_at", "-id")
+    )
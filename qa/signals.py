@@ -1,37 +1,82 @@
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 
-from .models import Question, AppSetting
+from .auth import forget_user
+from .models import Event, Question, AppSetting
+from .realtime import (
+    SCREENS, MODERATORS, broadcast_refresh, broadcast_transition, bump_settings_version,
+    row_signals_suppressed,
+)
 
 
-def _broadcast(group: str, reason: str):
-    layer = get_channel_layer()
-    if not layer:
-        return
-    async_to_sync(layer.group_send)(
-        group,
-        {"type": "broadcast.refresh", "reason": reason},
-    )
+def _broadcast(event_id, kind: str, reason: str, ids=()):
+    broadcast_refresh(event_id, kind, reason, ids=ids)
 
 
 @receiver(post_save, sender=Question)
 def question_saved(sender, instance: Question, created, **kwargs):
-    # Moderation page needs to update when new question comes or status changes
-    _broadcast("moderators", "question_saved")
-    # Screen updates when approved list changes
-    _broadcast("screens", "question_saved")
+    if row_signals_suppressed():
+        return
+    # Model.save() only records the new status after post_save, so this is the old one
+    old_status = instance._loaded_status
+    groups = None
+    if not created and old_status is None:
+        # loaded without its status (or built by hand) — don't guess
+        groups = {SCREENS, MODERATORS}
+
+    # Moderation page only lists pending questions; screens apply the change
+    # locally (upsert when approved, remove otherwise)
+    broadcast_transition(
+        instance.event_id, old_status, instance.status, [instance.pk],
+        questions=[instance], reason="question_saved", groups=groups,
+    )
 
 
 @receiver(post_delete, sender=Question)
 def question_deleted(sender, instance: Question, **kwargs):
-    _broadcast("moderators", "question_deleted")
-    _broadcast("screens", "question_deleted")
+    # QuestionQuerySet.delete() notifies once for all rows instead
+    if row_signals_suppressed():
+        return
+    broadcast_transition(
+        instance.event_id, instance._loaded_status, None, [instance.pk], reason="question_deleted",
+    )
 
 
 @receiver(post_save, sender=AppSetting)
 def settings_saved(sender, instance: AppSetting, created, **kwargs):
+    event_id = instance.event_id
+
+    # new settings.json snapshot from now on; other workers drop their cached copy
+    def invalidate():
+        bump_settings_version(event_id)
+        AppSetting.clear_solo_cache(event_id)
+
+    transaction.on_commit(invalidate)
     # Settings affect both screen and moderation UI
-    _broadcast("screens", "settings_saved")
-    _broadcast("moderators", "settings_saved")
+    _broadcast(event_id, SCREENS, "settings_saved")
+    _broadcast(event_id, MODERATORS, "settings_saved")
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def event_changed(sender, instance: Event, **kwargs):
+    # slug -> event lookups are cached; a renamed slug's old entry just expires
+    transaction.on_commit(lambda: cache.delete(Event.cache_key(instance.slug)))
+
+
+# Cached users (qa.auth): a changed staff flag, password or active flag, a deleted
+# user or a logout must not be answered from the cache
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
@@ -0,0 +1,72 @@
+import gzip
+import hashlib
+import json
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+# One serialized JSON document, stored in the shared cache so every worker
+# reuses it until the content version moves on.
+Snapshot = namedtuple("Snapshot", ["etag", "body", "gzipped"])
+
+_accepts_gzip = re.compile(r"\bgzip\b")
+
+
+def _key(name: str, version) -> str:
+    return f"qa:snap:{name}:{version}"
+
+
+def _timeout():
+    return getattr(settings, "QA_SNAPSHOT_TIMEOUT", 3600)
+
+
+def _serialize(payload) -> Snapshot:
+    body = json.dumps(payload, cls=DjangoJSONEncoder).encode("utf-8")
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()
+    return Snapshot(etag, body, gzip.compress(body, mtime=0))
+
+
+def get_snapshot(name: str, version, build) -> Snapshot:
+    """
+    Cached snapshot of `name` at `version`; `build()` (the DB work) only runs on a miss.
+    The ETag is a hash of the body, so it stays correct even if the version
+    counter is ever reset.
+    """
+    key = _key(name, version)
+    snap = cache.get(key)
+    if snap is None:
+        snap = _serialize(build())
+        cache.set(key, tuple(snap), timeout=_timeout())
+    return Snapshot(*snap)
+
+
+async def aget_snapshot(name: str, version, abuild) -> Snapshot:
+    """get_snapshot() for async views; `abuild` is a coroutine function."""
+    key = _key(name, version)
+    snap = await cache.aget(key)
+    if snap is None:
+        snap = _serialize(await abuild())
+        await cache.aset(key, tuple(snap), timeout=_timeout())
+    return Snapshot(*snap)
+
+
+def snapshot_response(request, snap: Snapshot) -> HttpResponse:
+    if snap.etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    elif _accepts_gzip.search(request.headers.get("Accept-Encoding", "")):
+        response = HttpResponse(snap.gzipped, content_type="application/json")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(snap.body, content_type="application/json")
+
+    response["ETag"] = snap.etag
+    # may be stored, but must be revalidated (cheap 304) before every reuse
+    response["Cache-Control"] = "no-cache"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
@@ -1,28 +1,68 @@
-import base64
-from io import BytesIO
-
-from django.http import JsonResponse, HttpResponseBadRequest
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import (
+    Http404, JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden,
+    HttpResponseNotModified, StreamingHttpResponse,
+)
 from django.shortcuts import render
 from django.urls import reverse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.cache import never_cache
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.utils import timezone
+from django.utils.http import parse_etags
 
-import qrcode
-from django_ratelimit.decorators import ratelimit
-
-from .models import Question, AppSetting
+from . import metrics
+from .models import Event, Question, AppSetting
 from .forms import AskForm
+from .dedup import save_new_question
+from .export import FORMATS as EXPORT_FORMATS, aiter_rows, arender_lines
+from .ingest import IngestBackpressure, enqueue_question, queue_mode
+from .moderation import ACTIONS, bulk_moderate, parse_filters
+from .pagination import afetch_page, page_params
+from .ratelimit import ask_allowed, get_device_id, set_device_cookie, vote_allowed
+from .search import search_questions
+from .qr import CONTENT_TYPES, qr_image, qr_etag
+from .realtime import QUESTION_FIELDS, acurrent_version, asettings_version
+from .snapshots import aget_snapshot, snapshot_response
+from .votes import cast_vote
+
+
+async def _ais_staff(user):
+    return user.is_authenticated and user.is_staff
 
 
 def staff_required(view):
+    # An async test keeps async views on the event loop (no thread hop per check).
+    # Failing either part redirects to login, same as login_required would.
+    if iscoroutinefunction(view):
+        return user_passes_test(_ais_staff)(view)
     return login_required(user_passes_test(lambda u: u.is_staff)(view))
 
 
-@never_cache
-def settings_json(request):
-    s = AppSetting.get_solo()
-    return JsonResponse({
+def _event(slug):
+    try:
+        return Event.resolve(slug)
+    except Event.DoesNotExist:
+        raise Http404("No such event")
+
+
+async def _aevent(slug):
+    try:
+        return await Event.aresolve(slug)
+    except Event.DoesNotExist:
+        raise Http404("No such event")
+
+
+def _ws_path(event, kind):
+    # mirrors qa.routing: the default event keeps the short socket URLs
+    if event.slug == Event.DEFAULT_SLUG:
+        return f"/ws/{kind}/"
+    return f"/ws/e/{event.slug}/{kind}/"
+
+
+def settings_payload(s):
+    return {
         "event_title": s.event_title,
         "background_color": s.background_color,
         "title_color": s.title_color,
@@ -34,126 +74,336 @@ def settings_json(request):
         "qr_size": s.qr_size,
         "max_question_length": s.max_question_length,
         "submissions_enabled": s.submissions_enabled,
-    })
+    }
+
+
+async def settings_json(request, event_slug):
+    event = await _aevent(event_slug)
+
+    async def build():
+        return settings_payload(await AppSetting.aget_solo(event))
+
+    snap = await aget_snapshot(f"settings:{event.id}", await asettings_version(event.id), build)
+    return snapshot_response(request, snap)
+
+
+async def _approved_payload(event, version, limit, before=None, after=None):
+    # near-duplicates of an approved question are shown once, as their root
+    qs = Question.objects.filter(event=event).listed(Question.STATUS_APPROVED).values(*QUESTION_FIELDS)
+    page = await afetch_page(qs, limit, before, after)
+    return {
+        "approved": page["rows"],
+        "version": version,
+        "next": page["next"],
+        "prev": page["prev"],
+    }
+
+
+async def _ranked_payload(event, version, limit):
+    # the screen's window: most voted first, newest first among equals; not paged,
+    # `more` says whether any approved question didn't make it in
+    qs = (
+        Question.objects.filter(event=event).listed(Question.STATUS_APPROVED)
+        .order_by("-votes", "-created_at", "-id").values(*QUESTION_FIELDS)
+    )
+    rows = [row async for row in qs[:limit + 1]]
+    return {
+        "approved": rows[:limit],
+        "version": version,
+        "more": len(rows) > limit,
+    }
+
+
+async def approved_questions_json(request, event_slug):
+    """
+    GET ?limit=N (newest N, default QA_SCREEN_WINDOW) and ?before=/?after=<cursor>
+    to page through older/newer approved questions; ?order=votes for the N most
+    voted instead (the screen's window, no paging).
+    """
+    try:
+        limit, before, after = page_params(request, getattr(settings, "QA_SCREEN_WINDOW", 20))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    ranked = request.GET.get("order") == "votes"
+    if ranked and (before or after):
+        return HttpResponseBadRequest("order=votes is not paged")
+    event = await _aevent(event_slug)
+
+    if before or after:
+        # deep pages are rare (moderator/back-office use); query them directly
+        version = await acurrent_version(event.id)
+        return JsonResponse(await _approved_payload(event, version, limit, before, after))
+    return snapshot_response(request, await approved_snapshot(event, limit, ranked))
+
+
+async def approved_snapshot(event, limit, ranked=False):
+    """
+    The newest (or with `ranked`, the most voted) `limit` approved questions as
+    a cached Snapshot, shared by every screen of the event (approved.json and
+    the socket's initial state).
+    """
+    # Read the version first: the rows are then at least as new as it,
+    # and replaying later deltas on top of them is idempotent.
+    version = await acurrent_version(event.id)
+    if ranked:
+        return await aget_snapshot(
+            f"approved:{event.id}:{limit}:votes", version, lambda: _ranked_payload(event, version, limit),
+        )
+    return await aget_snapshot(
+        f"approved:{event.id}:{limit}", version, lambda: _approved_payload(event, version, limit),
+    )
 
 
 @never_cache
-def approved_questions_json(request):
-    qs = (Question.objects
-          .filter(status=Question.STATUS_APPROVED)
-          .order_by("-created_at")
-          .values("id", "name", "question", "created_at"))
-    return JsonResponse({"approved": list(qs)})
+@staff_required
+async def pending_questions_json(request, event_slug):
+    """
+    Same paging as approved.json, plus the total number pending. Near-duplicates
+    are folded into their root, which carries how many there are (`similar`);
+    `duplicate_of` is set on a question similar to one already approved.
+    """
+    try:
+        limit, before, after = page_params(request, getattr(settings, "QA_MODERATION_PAGE_SIZE", 100))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    event = await _aevent(event_slug)
+    return JsonResponse(await pending_payload(event, limit, before, after))
+
+
+async def pending_payload(event, limit, before=None, after=None):
+    qs = Question.objects.filter(event=event).listed(Question.STATUS_PENDING)
+    rows = qs.with_similar().values(*QUESTION_FIELDS, "duplicate_of", "similar")
+    page = await afetch_page(rows, limit, before, after)
+    return {
+        "pending": page["rows"],
+        "total": await qs.acount(),
+        "next": page["next"],
+        "prev": page["prev"],
+    }
 
 
 @never_cache
 @staff_required
-def pending_questions_json(request):
-    qs = (Question.objects
-          .filter(status=Question.STATUS_PENDING)
-          .order_by("-created_at")
-          .values("id", "name", "question", "created_at"))
-    return JsonResponse({"pending": list(qs)})
+async def search_questions_json(request, event_slug):
+    """
+    GET ?q=<terms> [&status=pending|approved|rejected] [&limit=N]
+    Questions of the event matching q, best match first (see qa.search).
+    """
+    term = (request.GET.get("q") or "").strip()
+    if not term:
+        return HttpResponseBadRequest("No search term")
+    status = request.GET.get("status")
+    if status and status not in dict(Question.STATUS_CHOICES):
+        return HttpResponseBadRequest("Invalid status")
+    try:
+        limit, _, _ = page_params(request, 50)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    event = await _aevent(event_slug)
+    qs = Question.objects.filter(event=event)
+    if status:
+        qs = qs.filter(status=status)
+    qs = search_questions(qs, term).values(*QUESTION_FIELDS, "status", "search_rank")[:limit]
+    return JsonResponse({"q": term, "results": [row async for row in qs]})
 
 
 @never_cache
-def screen_view(request):
-    s = AppSetting.get_solo()
-    ask_url = request.build_absolute_uri(reverse("ask"))
-
-    # QR code points to /ask (absolute)
-    qr = qrcode.QRCode(
-        version=3,
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=8,
-        border=2,
-    )
-    qr.add_data(ask_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buff = BytesIO()
-    img.save(buff, format="PNG")
-    qr_b64 = base64.b64encode(buff.getvalue()).decode("ascii")
+def screen_view(request, event_slug):
+    event = _event(event_slug)
+    s = AppSetting.get_solo(event)
+    ask_url = request.build_absolute_uri(reverse("ask", kwargs={"event_slug": event.slug}))
+    fmt = getattr(settings, "QA_QR_FORMAT", "png")
 
     return render(request, "qa/screen.html", {
-        "qr_data_uri": f"data:image/png;base64,{qr_b64}",
+        "event": event,
+        "qr_url": reverse(f"screen_qr_{fmt}", kwargs={"event_slug": event.slug}),
         "ask_url": ask_url,
+        "ws_path": _ws_path(event, "screen"),
+        "window": getattr(settings, "QA_SCREEN_WINDOW", 20),
         "s": s,
     })
 
 
+@require_http_methods(["GET", "HEAD"])
+def screen_qr(request, event_slug, fmt):
+    # QR code points to the event's /ask (absolute); it only changes with the host,
+    # so let browsers and the proxy keep it
+    event = _event(event_slug)
+    ask_url = request.build_absolute_uri(reverse("ask", kwargs={"event_slug": event.slug}))
+    image = qr_image(ask_url, fmt)
+    etag = qr_etag(image)
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(image, content_type=CONTENT_TYPES[fmt])
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=86400"
+    return response
+
+
 @require_http_methods(["GET", "POST"])
-@ratelimit(key="ip", rate="5/m", block=True)
-def ask_view(request):
-    s = AppSetting.get_solo()
+async def ask_view(request, event_slug):
+    event = await _aevent(event_slug)
+    s = await AppSetting.aget_solo(event)
+    status = 200
 
     if request.method == "POST":
-        form = AskForm(request.POST)
-        if form.is_valid():
-            obj = form.save(commit=False)
-            obj.status = Question.STATUS_PENDING
-            obj.save()
-            return render(request, "qa/ask_success.html")
+        form = AskForm(request.POST, app_settings=s)
+        if not await sync_to_async(ask_allowed)(request):
+            form.add_error(None, "You're sending questions too quickly. Please wait a minute and try again.")
+            status = 429
+        elif form.is_valid():
+            if queue_mode():
+                # burst mode: the ingest worker writes it (batched) shortly
+                try:
+                    await sync_to_async(enqueue_question)(
+                        event.id, form.cleaned_data.get("name"), form.cleaned_data["question"],
+                    )
+                    return set_device_cookie(request, render(request, "qa/ask_success.html", {"event": event}))
+                except IngestBackpressure:
+                    form.add_error(None, "We're receiving a lot of questions right now. Please try again in a moment.")
+                    status = 503
+            else:
+                obj = form.save(commit=False)
+                obj.event_id = event.id
+                obj.status = Question.STATUS_PENDING
+                await sync_to_async(save_new_question)(obj)
+                return set_device_cookie(request, render(request, "qa/ask_success.html", {"event": event}))
     else:
-        form = AskForm()
+        form = AskForm(app_settings=s)
 
-    return render(request, "qa/ask.html", {
+    response = render(request, "qa/ask.html", {
+        "event": event,
         "form": form,
         "submissions_enabled": s.submissions_enabled,
         "max_len": s.max_question_length,
-    })
+    }, status=status)
+    return set_device_cookie(request, response)
+
+
+@require_http_methods(["POST"])
+async def vote_view(request, event_slug):
+    """
+    POST id=<approved question id>: one upvote from this phone. Phones are told
+    apart by the device cookie /ask/ hands out; a repeat vote is not counted.
+    """
+    event = await _aevent(event_slug)
+    device = get_device_id(request)
+    if device is None:
+        return HttpResponseForbidden("Open the question page first")
+    try:
+        question_id = int(request.POST.get("id") or "")
+    except ValueError:
+        return HttpResponseBadRequest("Invalid id")
+
+    if not await sync_to_async(vote_allowed)(device):
+        return JsonResponse({"ok": False, "error": "Too many votes, slow down."}, status=429)
+    # before the device is remembered as having voted: a vote on a question that
+    # isn't (yet) approved here must neither count nor use up the device's vote
+    approved = Question.objects.filter(pk=question_id, event_id=event.id, status=Question.STATUS_APPROVED)
+    if not await approved.aexists():
+        return JsonResponse({"ok": False, "error": "No such question."}, status=404)
+    # buffered: screens see the new totals with the next flush (qa.votes)
+    counted = await sync_to_async(cast_vote)(event.id, question_id, device)
+    return JsonResponse({"ok": True, "counted": counted})
 
 
 @never_cache
 @staff_required
-def moderation_view(request):
+def moderation_view(request, event_slug):
     # Main moderation tool (staff only)
-    return render(request, "qa/moderation.html", {})
-
+    event = _event(event_slug)
+    return render(request, "qa/moderation.html", {
+        "event": event,
+        "ws_path": _ws_path(event, "moderation"),
+    })
 
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 
 @require_http_methods(["POST"])
 @staff_required
-def moderation_action(request):
+def moderation_action(request, event_slug):
     """
     POST:
       action = approve | reject | delete
       ids = comma-separated list of question IDs
+
+    Acts on whole clusters: the near-duplicates folded into a question share its fate.
     """
     action = (request.POST.get("action") or "").strip()
     ids_raw = (request.POST.get("ids") or "").strip()
 
-    if action not in {"approve", "reject", "delete"}:
+    if action not in ACTIONS:
         return HttpResponseBadRequest("Invalid action")
 
     if not ids_raw:
         return HttpResponseBadRequest("No ids")
 
     try:
-        ids = [int(x) for x in ids_raw.split(",") if x.strip()]
-    except ValueError:
-        return HttpResponseBadRequest("Invalid ids")
+        filters = parse_filters({"ids": ids_raw})
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
 
-    qs = Question.objects.filter(id__in=ids)
+    # ids from another event are ignored rather than moderated from the wrong room
+    bulk_moderate(_event(event_slug), action, filters, reason="moderation_action", clusters=True)
 
-    if action == "approve":
-        qs.update(status=Question.STATUS_APPROVED)
-    elif action == "reject":
-        qs.update(status=Question.STATUS_REJECTED)
-    else:
-        qs.delete()
+    return JsonResponse({"ok": True})
 
-    # 🔥 MANUAL REAL-TIME BROADCAST (THIS IS THE FIX)
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        "moderators",
-        {"type": "broadcast.refresh", "reason": "moderation_action"},
-    )
-    async_to_sync(channel_layer.group_send)(
-        "screens",
-        {"type": "broadcast.refresh", "reason": "moderation_action"},
-    )
 
-    return JsonResponse({"ok": True})
+@require_http_methods(["POST"])
+@staff_required
+def moderation_bulk(request, event_slug):
+    """
+    POST:
+      action = approve | reject | delete
+      filters: status, created_after, created_before, name, text (see parse_filters)
+      preview = 1 to only count the matching questions
+
+    Runs in chunks; moderators get "progress" messages over the socket meanwhile.
+    """
+    action = (request.POST.get("action") or "").strip()
+    if action not in ACTIONS:
+        return HttpResponseBadRequest("Invalid action")
+
+    try:
+        filters = parse_filters(request.POST)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    event = _event(event_slug)
+    if request.POST.get("preview"):
+        matched = Question.objects.filter(event=event, **filters).exclude(status=ACTIONS[action]).count()
+        return JsonResponse({"ok": True, "matched": matched})
+
+    changed = bulk_moderate(event, action, filters)
+    return JsonResponse({"ok": True, "changed": changed})
+
+
+@never_cache
+@staff_required
+async def export_questions(request, event_slug, fmt):
+    """
+    GET, optional filters as for bulk moderation (status, created_after,
+    created_before, name, text): every matching question of the event, oldest
+    first, streamed as CSV or NDJSON.
+    """
+    try:
+        filters = parse_filters(request.GET, required=False)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    event = await _aevent(event_slug)
+
+    rows = aiter_rows({"event_id": event.id, **filters})
+    response = StreamingHttpResponse(arender_lines(rows, fmt), content_type=EXPORT_FORMATS[fmt])
+    filename = f"questions-{event.slug}-{timezone.localdate():%Y%m%d}.{fmt}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@never_cache
+@staff_required
+def metrics_view(request):
+    if not metrics.enabled():
+        raise Http404("Metrics are disabled")
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,176 @@
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+
+from . import metrics
+from .models import Question
+from .realtime import broadcast_votes
+
+logger = logging.getLogger(__name__)
+
+# Audience upvotes on approved questions. Casting a vote only touches the buffer:
+# a per-question set of device ids (one vote per device) and a hash of pending
+# increments, in Redis or in process memory. VoteFlusher adds the increments to
+# Question.votes every QA_VOTES_FLUSH_INTERVAL_MS — one UPDATE per event, however
+# many taps a popular question gets — and sends the event's screens a single
+# "votes" delta with the new totals.
+
+PENDING_KEY = "qa:votes:pending"
+
+
+def _conf(name, default):
+    return getattr(settings, name, default)
+
+
+def _field(event_id, question_id):
+    return f"{event_id}:{question_id}"
+
+
+# Count the vote only if the device is new to this question; one round trip.
+_CAST = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+return 1
+"""
+
+# Hand the buffered increments to one flusher and start a fresh buffer.
+_TAKE = """
+local votes = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return votes
+"""
+
+
+class RedisVoteBuffer:
+    """
+    Shared across workers, so any number of flushers can run. A flusher that
+    dies between taking a batch and committing it loses that batch's votes.
+    """
+
+    def __init__(self, client, prefix="qa:votes:"):
+        self.client = client
+        self.prefix = prefix
+        self._cast = client.register_script(_CAST)
+        self._take = client.register_script(_TAKE)
+
+    def cast(self, event_id, question_id, device) -> bool:
+        return bool(self._cast(
+            keys=[f"{self.prefix}voters:{question_id}", PENDING_KEY],
+            args=[device, _field(event_id, question_id), _conf("QA_VOTES_TTL", 2 * 86400)],
+        ))
+
+    def take(self) -> dict:
+        """{(event_id, question_id): increment} buffered since the last take."""
+        raw = self._take(keys=[PENDING_KEY])
+        pending = {}
+        for field, count in zip(raw[::2], raw[1::2]):
+            event_id, question_id = field.decode().split(":")
+            pending[(int(event_id), int(question_id))] = int(count)
+        return pending
+
+
+class LocalVoteBuffer:
+    """Same semantics in process memory — for tests and single-worker dev."""
+
+    def __init__(self):
+        self._voters = defaultdict(set)
+        self._pending = Counter()
+        self._lock = threading.Lock()
+
+    def cast(self, event_id, question_id, device) -> bool:
+        with self._lock:
+            voters = self._voters[question_id]
+            if device in voters:
+                return False
+            voters.add(device)
+            self._pending[(event_id, question_id)] += 1
+            return True
+
+    def take(self) -> dict:
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        return dict(pending)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                if _conf("QA_VOTES_BACKEND", "redis") == "local":
+                    _buffer = LocalVoteBuffer()
+                    # nobody else can flush an in-process buffer
+                    VoteFlusher(_buffer).start()
+                else:
+                    from .redis_client import get_redis
+                    _buffer = RedisVoteBuffer(get_redis())
+    return _buffer
+
+
+def cast_vote(event_id, question_id, device) -> bool:
+    """One upvote from `device`; False if it already voted for this question."""
+    counted = get_buffer().cast(event_id, question_id, device)
+    if metrics.enabled():
+        metrics.votes.inc(outcome="counted" if counted else "repeat")
+    return counted
+
+
+def apply_votes(pending):
+    """
+    Add {(event_id, question_id): increment} to Question.votes and tell screens.
+    Votes for questions that are not (or no longer) approved are dropped.
+    Returns {event_id: {question_id: new total}}.
+    """
+    by_event = defaultdict(dict)
+    for (event_id, question_id), n in pending.items():
+        by_event[event_id][question_id] = n
+
+    totals = {}
+    for event_id, increments in by_event.items():
+        with transaction.atomic():
+            qs = Question.objects.filter(event_id=event_id, pk__in=increments, status=Question.STATUS_APPROVED)
+            qs.update(votes=F("votes") + Case(
+                *[When(pk=pk, then=Value(n)) for pk, n in increments.items()], default=Value(0),
+            ))
+            counts = dict(qs.values_list("pk", "votes"))
+            if counts:
+                broadcast_votes(event_id, counts)
+        totals[event_id] = counts
+    return totals
+
+
+class VoteFlusher:
+    def __init__(self, buffer, flush_interval=None):
+        self.buffer = buffer
+        interval_ms = flush_interval if flush_interval is not None else _conf("QA_VOTES_FLUSH_INTERVAL_MS", 1000)
+        self.flush_interval = interval_ms / 1000
+        self._stop = threading.Event()
+
+    def run_once(self):
+        return apply_votes(self.buffer.take())
+
+    def run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("vote flush failed")
+            # don't sit on a (pooled) connection until the next flush
+            close_old_connections()
+
+    def start(self):
+        threading.Thread(target=self.run, name="qa-votes", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
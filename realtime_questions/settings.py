@@ -50,6 +50,8 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    # trigram lookups for qa.search (harmless on other databases)
+    "django.contrib.postgres",
 
     "channels",
     "qa",
@@ -59,6 +61,8 @@ INSTALLED_APPS = [
 # MIDDLEWARE
 # --------------------------------------------------
 MIDDLEWARE = [
+    # first, so its timings cover the whole stack; a no-op unless QA_METRICS_ENABLED
+    "qa.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -104,11 +108,29 @@ import dj_database_url
 DATABASES = {
     "default": dj_database_url.parse(
         env("DATABASE_URL"),
-        conn_max_age=60,
+        conn_max_age=env.int("DB_CONN_MAX_AGE", default=60),
+        # a connection the server dropped is replaced instead of failing the request
+        conn_health_checks=True,
         ssl_require=False,
     )
 }
 
+# Connection pool (PostgreSQL, psycopg[pool]). Under daphne sync code runs in
+# rotating executor threads, and each thread would otherwise keep a persistent
+# connection of its own; pooled, a request borrows one and hands it back when it
+# finishes. DB_POOL_MAX_SIZE caps the connections of one worker process, so
+# max_connections needs roughly workers x DB_POOL_MAX_SIZE (+ management commands).
+# Requests wait up to DB_POOL_TIMEOUT seconds for a free connection, then fail.
+if env.bool("DB_POOL", default=True) and DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    DATABASES["default"]["CONN_MAX_AGE"] = 0  # required by the pool: connections go back, not stay with the thread
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": env.int("DB_POOL_MIN_SIZE", default=2),
+        "max_size": env.int("DB_POOL_MAX_SIZE", default=10),
+        "timeout": env.float("DB_POOL_TIMEOUT", default=10.0),
+        "max_idle": env.float("DB_POOL_MAX_IDLE", default=300.0),
+        "max_lifetime": env.float("DB_POOL_MAX_LIFETIME", default=1800.0),
+    }
+
 
 # --------------------------------------------------
 # PASSWORD VALIDATION
@@ -152,15 +174,157 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # --------------------------------------------------
 REDIS_URL = env("REDIS_URL", default="redis://127.0.0.1:6379/0")
 
+# Websocket fan-out (QA_CHANNEL_BACKEND):
+#   "pubsub"  Redis pub/sub: a group_send is one PUBLISH however many sockets are
+#             in the group; each server process delivers to its own members
+#   "redis"   channels_redis core: one list push per member channel per message
+#   "memory"  in-process (qa.layers), for a single server process and tests
+# Screens resync on a version gap, so pub/sub's at-most-once delivery is enough.
+QA_CHANNEL_BACKEND = env("QA_CHANNEL_BACKEND", default="pubsub")
+
+# Messages a socket may have queued before new ones are dropped, and seconds a
+# queued message stays deliverable (stale updates are useless to a live screen)
+QA_CHANNEL_CAPACITY = env.int("QA_CHANNEL_CAPACITY", default=200)
+QA_CHANNEL_EXPIRY = env.int("QA_CHANNEL_EXPIRY", default=10)
+
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [REDIS_URL],
+        "pubsub": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {
+                "hosts": [REDIS_URL],
+            },
+        },
+        "redis": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [REDIS_URL],
+                "capacity": QA_CHANNEL_CAPACITY,
+                "expiry": QA_CHANNEL_EXPIRY,
+            },
+        },
+        "memory": {
+            "BACKEND": "qa.layers.InProcessChannelLayer",
+            "CONFIG": {
+                "capacity": QA_CHANNEL_CAPACITY,
+                "expiry": QA_CHANNEL_EXPIRY,
+            },
+        },
+    }[QA_CHANNEL_BACKEND]
+}
+
+# Per-socket backpressure (qa.consumers): messages a socket may have waiting before
+# they collapse into one "resync", seconds between pings, and seconds without a
+# pong before the socket is closed as dead
+QA_WS_QUEUE_SIZE = env.int("QA_WS_QUEUE_SIZE", default=50)
+QA_WS_PING_INTERVAL = env.float("QA_WS_PING_INTERVAL", default=15.0)
+QA_WS_IDLE_TIMEOUT = env.float("QA_WS_IDLE_TIMEOUT", default=45.0)
+
+# Screens reconnecting with ?since=<version> are sent only what they missed, from a
+# log of each event's last QA_REPLAY_SIZE changes (Redis, or "local" in-process)
+QA_REPLAY_BACKEND = env("QA_REPLAY_BACKEND", default="redis")
+QA_REPLAY_SIZE = env.int("QA_REPLAY_SIZE", default=200)
+QA_REPLAY_TTL = env.int("QA_REPLAY_TTL", default=2 * 86400)
+
+# How long a serialized approved.json / settings.json snapshot may sit in the cache
+QA_SNAPSHOT_TIMEOUT = env.int("QA_SNAPSHOT_TIMEOUT", default=3600)
+
+# Seconds a worker trusts its in-process AppSetting copy before re-checking the shared version
+QA_SETTINGS_LOCAL_TTL = env.float("QA_SETTINGS_LOCAL_TTL", default=1.0)
+
+# Questions a screen shows (the approved.json window) and a moderation page loads at once
+QA_SCREEN_WINDOW = env.int("QA_SCREEN_WINDOW", default=20)
+QA_MODERATION_PAGE_SIZE = env.int("QA_MODERATION_PAGE_SIZE", default=100)
+
+# Filter-based bulk moderation changes at most this many rows per statement/transaction
+QA_BULK_CHUNK_SIZE = env.int("QA_BULK_CHUNK_SIZE", default=500)
+
+# Rows fetched per round trip by the CSV/NDJSON export (server-side cursor on PostgreSQL)
+QA_EXPORT_CHUNK_SIZE = env.int("QA_EXPORT_CHUNK_SIZE", default=2000)
+
+# `manage.py qa_retention` moves/deletes at most this many questions per transaction
+QA_RETENTION_BATCH_SIZE = env.int("QA_RETENTION_BATCH_SIZE", default=1000)
+
+# /screen/ QR image format: "png", or "svg" to stay sharp on large projectors
+QA_QR_FORMAT = env("QA_QR_FORMAT", default="png")
+# seconds a rendered QR image stays in the shared cache (one per host it was asked for)
+QA_QR_CACHE_TIMEOUT = env.int("QA_QR_CACHE_TIMEOUT", default=86400)
+
+# /ask/ ingestion: "direct" saves each question in the request; "queue" enqueues it
+# (Redis stream, or "local" in-process queue) for `manage.py qa_ingest` to bulk insert
+QA_INGEST_MODE = env("QA_INGEST_MODE", default="direct")
+QA_INGEST_BACKEND = env("QA_INGEST_BACKEND", default="redis")
+QA_INGEST_BATCH_SIZE = env.int("QA_INGEST_BATCH_SIZE", default=200)
+QA_INGEST_FLUSH_INTERVAL_MS = env.int("QA_INGEST_FLUSH_INTERVAL_MS", default=500)
+QA_INGEST_MAX_BACKLOG = env.int("QA_INGEST_MAX_BACKLOG", default=50000)
+# A batch that fails this many times in a row is written one question at a time;
+# questions that still fail go to the qa:ingest:dead stream instead of blocking the queue
+QA_INGEST_MAX_RETRIES = env.int("QA_INGEST_MAX_RETRIES", default=3)
+# Redis consumer name of this `qa_ingest` worker (default: the hostname); keep it
+# stable across restarts. Entries another worker read but left unacked this long
+# (it died) are taken over.
+QA_INGEST_CONSUMER = env("QA_INGEST_CONSUMER", default="")
+QA_INGEST_CLAIM_IDLE_MS = env.int("QA_INGEST_CLAIM_IDLE_MS", default=60000)
+
+# Near-duplicate folding on /ask/: a question at least this similar (0-1, estimated
+# Jaccard of character 3-grams) to a pending/approved one joins its cluster.
+# Index in Redis ("local" = in-process, single worker); entries expire after QA_DEDUP_TTL s
+QA_DEDUP_ENABLED = env.bool("QA_DEDUP_ENABLED", default=True)
+QA_DEDUP_BACKEND = env("QA_DEDUP_BACKEND", default="redis")
+QA_DEDUP_THRESHOLD = env.float("QA_DEDUP_THRESHOLD", default=0.5)
+QA_DEDUP_TTL = env.int("QA_DEDUP_TTL", default=2 * 86400)
+
+# Audience upvotes: buffered in Redis ("local" = in-process, single worker) and added
+# to the database every QA_VOTES_FLUSH_INTERVAL_MS by `manage.py qa_votes`, which also
+# sends screens the new totals. Devices that voted are remembered for QA_VOTES_TTL s
+QA_VOTES_BACKEND = env("QA_VOTES_BACKEND", default="redis")
+QA_VOTES_FLUSH_INTERVAL_MS = env.int("QA_VOTES_FLUSH_INTERVAL_MS", default=1000)
+QA_VOTES_TTL = env.int("QA_VOTES_TTL", default=2 * 86400)
+
+# Channel-layer broadcasts are merged per group within this window (0 = no merging delay)
+QA_BROADCAST_WINDOW_MS = env.int("QA_BROADCAST_WINDOW_MS", default=250)
+
+# Request/DB/websocket metrics at /metrics/ (staff only, Prometheus text format)
+QA_METRICS_ENABLED = env.bool("QA_METRICS_ENABLED", default=False)
+
+# Bounded per-process Redis pools: a burst waits up to REDIS_POOL_TIMEOUT seconds for a
+# free connection instead of opening hundreds of them
+REDIS_MAX_CONNECTIONS = env.int("REDIS_MAX_CONNECTIONS", default=50)
+REDIS_POOL_TIMEOUT = env.int("REDIS_POOL_TIMEOUT", default=5)
+
+# Shared cache: version counters, snapshots and settings must be the same across daphne workers
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": env("CACHE_URL", default=REDIS_URL),
+        "OPTIONS": {
+            "pool_class": "redis.BlockingConnectionPool",
+            "max_connections": REDIS_MAX_CONNECTIONS,
+            "timeout": REDIS_POOL_TIMEOUT,
         },
     }
 }
 
+# Sessions and the logged-in user come from the shared cache (sessions written through
+# to the database), so moderator tabs reconnecting after a deploy don't each query the
+# session and user tables. qa.auth drops a cached user on save, delete and logout;
+# QA_AUTH_CACHE_TTL seconds bounds anything else (e.g. QuerySet.update on users).
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+AUTHENTICATION_BACKENDS = [
+    "qa.auth.CachedModelBackend",
+    # sessions from before qa.auth still name this one
+    "django.contrib.auth.backends.ModelBackend",
+]
+QA_AUTH_CACHE_TTL = env.int("QA_AUTH_CACHE_TTL", default=300)
+
+# /ask/ limits: per device (signed cookie), and a looser one shared by everyone
+# behind the same IP (venue NAT); upvote taps per device. "local" keeps counters in
+# process (tests/dev).
+QA_ASK_RATE = env("QA_ASK_RATE", default="5/m")
+QA_ASK_IP_RATE = env("QA_ASK_IP_RATE", default="120/m")
+QA_VOTE_RATE = env("QA_VOTE_RATE", default="60/m")
+QA_RATELIMIT_BACKEND = env("QA_RATELIMIT_BACKEND", default="redis")
+
 # --------------------------------------------------
 # SECURITY (PRODUCTION SAFE)
 # --------------------------------------------------
@@ -1,19 +1,35 @@
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 from qa import views as qa_views
+from qa.models import Event
 
-urlpatterns = [
-    path("admin/", admin.site.urls),
-
+# Everything below is per event: /e/<slug>/screen/, /e/<slug>/ask/, ...
+# The un-prefixed URLs are the same views for the default event.
+event_urlpatterns = [
     path("screen/", qa_views.screen_view, name="screen"),
+    path("screen/qr.png", qa_views.screen_qr, {"fmt": "png"}, name="screen_qr_png"),
+    path("screen/qr.svg", qa_views.screen_qr, {"fmt": "svg"}, name="screen_qr_svg"),
     path("ask/", qa_views.ask_view, name="ask"),
+    path("vote/", qa_views.vote_view, name="vote"),
 
     # JSON endpoints (used by websocket-triggered refresh)
     path("screen/approved.json", qa_views.approved_questions_json, name="approved_questions_json"),
     path("moderation/pending.json", qa_views.pending_questions_json, name="pending_questions_json"),
+    path("moderation/search.json", qa_views.search_questions_json, name="search_questions_json"),
+    path("moderation/export.csv", qa_views.export_questions, {"fmt": "csv"}, name="export_csv"),
+    path("moderation/export.ndjson", qa_views.export_questions, {"fmt": "ndjson"}, name="export_ndjson"),
     path("settings.json", qa_views.settings_json, name="settings_json"),
 
     # Main admin tool
     path("moderation/", qa_views.moderation_view, name="moderation"),
     path("moderation/action/", qa_views.moderation_action, name="moderation_action"),
+    path("moderation/bulk/", qa_views.moderation_bulk, name="moderation_bulk"),
+]
+
+urlpatterns = [
+    path("admin/", admin.site.urls),
+    path("metrics/", qa_views.metrics_view, name="metrics"),
+
+    path("e/<slug:event_slug>/", include(event_urlpatterns)),
+    path("", include(event_urlpatterns), {"event_slug": Event.DEFAULT_SLUG}),
 ]
@@ -1,18 +1,55 @@
 -- PostgreSQL schema equivalent (Django migrations create these tables)
 
+CREATE TABLE IF NOT EXISTS qa_event (
+    id bigserial PRIMARY KEY,
+    slug varchar(64) NOT NULL UNIQUE,
+    name varchar(200) NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT NOW()
+);
+
 CREATE TABLE IF NOT EXISTS qa_appsetting (
-    id bigint PRIMARY KEY,
+    id bigserial PRIMARY KEY,
+    event_id bigint NOT NULL UNIQUE REFERENCES qa_event (id) ON DELETE CASCADE,
     max_question_length integer NOT NULL CHECK (max_question_length >= 10),
     submissions_enabled boolean NOT NULL
 );
 
 CREATE TABLE IF NOT EXISTS qa_question (
     id bigserial PRIMARY KEY,
+    event_id bigint NOT NULL REFERENCES qa_event (id) ON DELETE CASCADE,
     name varchar(120) NULL,
     question text NOT NULL,
     status varchar(16) NOT NULL,
-    created_at timestamptz NOT NULL DEFAULT NOW()
+    created_at timestamptz NOT NULL DEFAULT NOW(),
+    -- near-duplicate folding: the cluster root (see qa.dedup)
+    duplicate_of_id bigint NULL REFERENCES qa_question (id) ON DELETE SET NULL,
+    votes integer NOT NULL DEFAULT 0 CHECK (votes >= 0)
 );
 
-CREATE INDEX IF NOT EXISTS qa_question_status_created_at_idx
-    ON qa_question (status, created_at DESC);
+CREATE INDEX IF NOT EXISTS qa_question_duplicate_of_id_idx ON qa_question (duplicate_of_id);
+
+-- every feed is "one event, one status, newest first"
+CREATE INDEX IF NOT EXISTS qa_question_event_status_created_at_idx
+    ON qa_question (event_id, status, created_at DESC);
+
+-- the screen's window: most voted first
+CREATE INDEX IF NOT EXISTS qa_question_event_status_votes_idx
+    ON qa_question (event_id, status, votes DESC, created_at DESC);
+
+-- questions moved out by `manage.py qa_retention archive`; one partition per month
+-- of created_at (qa.retention creates them), dropped whole by `qa_retention drop`
+CREATE TABLE IF NOT EXISTS qa_question_archive (
+    id bigint NOT NULL,
+    event_id bigint NOT NULL REFERENCES qa_event (id) ON DELETE CASCADE,
+    name varchar(120) NULL,
+    question text NOT NULL,
+    status varchar(16) NOT NULL,
+    created_at timestamptz NOT NULL,
+    votes integer NOT NULL CHECK (votes >= 0),
+    duplicate_of_id bigint NULL,
+    archived_at timestamptz NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX IF NOT EXISTS qa_archive_event_created_idx
+    ON qa_question_archive (event_id, created_at);